@@ -4,5 +4,5 @@ from django.apps import AppConfig
 class ProductConfig(AppConfig):
     name = 'apps.product'
 
-def ready(self):
-    import apps.product.utils
\ No newline at end of file
+    def ready(self):
+        import apps.product.signals
@@ -0,0 +1,114 @@
+"""
+Перенос долго неактивных товаров в архивные таблицы и обратно.
+
+Товар, неактивный дольше PRODUCT_ARCHIVE_AFTER_DAYS, вместе с фото и
+счётчиком просмотров переезжает в ArchivedProduct / ArchivedProductImage и
+пропадает из поискового индекса - горячая таблица и индексы остаются по
+размеру живого каталога. Каждая пачка - отдельная короткая транзакция.
+Файлы фото не трогаются; восстановление возвращает товар с теми же id и uuid.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.product.cache import defer_invalidation, invalidate
+from apps.product.models import (
+    ArchivedProduct, ArchivedProductImage, Product, ProductImage, ProductStats,
+)
+from apps.product.search import product_index
+from core.db_router import PRIMARY, use_primary
+
+PRODUCT_FIELDS = (
+    "id", "uuid", "category_id", "model_id", "title", "description", "price",
+    "created_at", "updated_at", "size", "is_active",
+)
+IMAGE_FIELDS = ("id", "product_id", "image", "thumbnail", "webp")
+
+
+def archive_cutoff():
+    return timezone.now() - timedelta(days=settings.PRODUCT_ARCHIVE_AFTER_DAYS)
+
+
+def _raw_delete(queryset):
+    # Без сигналов: фото не освобождают файлы (на них ссылается архив) и не
+    # трогают updated_at товара, который удаляется в той же пачке.
+    return queryset._raw_delete(PRIMARY)
+
+
+def archive_batch(cutoff, batch_size):
+    """Архивирует до batch_size товаров; возвращает их число."""
+    # Выборка, копия и удаление - в одной транзакции на основной базе:
+    # данные реплики могут отставать.
+    with use_primary(), transaction.atomic(using=PRIMARY), defer_invalidation():
+        candidates = Product.objects.using(PRIMARY).filter(is_active=False, updated_at__lt=cutoff)
+        ids = list(candidates.order_by("updated_at").values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return 0
+        rows = list(candidates.filter(pk__in=ids).values(*PRODUCT_FIELDS))
+        views = dict(
+            ProductStats.objects.using(PRIMARY).filter(product_id__in=ids)
+            .values_list("product_id", "views")
+        )
+        ArchivedProduct.objects.using(PRIMARY).bulk_create(
+            ArchivedProduct(**row, views=views.get(row["id"], 0)) for row in rows
+        )
+        ArchivedProductImage.objects.using(PRIMARY).bulk_create(
+            ArchivedProductImage(**row)
+            for row in ProductImage.objects.using(PRIMARY).filter(product_id__in=ids).values(*IMAGE_FIELDS)
+        )
+        _raw_delete(ProductStats.objects.filter(product_id__in=ids))
+        _raw_delete(ProductImage.objects.filter(product_id__in=ids))
+        # Удаляются только те, кто всё ещё подходит под условие архивации.
+        deleted = _raw_delete(candidates.filter(pk__in=ids))
+        if deleted != len(rows):
+            raise RuntimeError("Товары изменились во время архивации, пачка отменена.")
+        product_index.remove(ids)
+        invalidate(Product, ProductImage, ProductStats)
+    return len(ids)
+
+
+def archive_products(cutoff=None, batch_size=None, max_batches=None, progress=None):
+    cutoff = cutoff or archive_cutoff()
+    batch_size = batch_size or settings.PRODUCT_ARCHIVE_BATCH_SIZE
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(cutoff, batch_size)
+        if not count:
+            break
+        total += count
+        batches += 1
+        if progress:
+            progress(total)
+    return total
+
+
+def restore_products(uuids):
+    """Возвращает товары из архива (как были - обычно неактивными)."""
+    with use_primary(), transaction.atomic(using=PRIMARY), defer_invalidation():
+        archived = list(
+            ArchivedProduct.objects.using(PRIMARY).filter(uuid__in=uuids)
+            .values(*PRODUCT_FIELDS, "views")
+        )
+        if not archived:
+            return 0
+        ids = [row["id"] for row in archived]
+        products = [Product(**{field: row[field] for field in PRODUCT_FIELDS}) for row in archived]
+        # bulk_create переписывает created_at (auto_now_add) - возвращаем исходные.
+        Product.objects.using(PRIMARY).bulk_create(products)
+        for product, row in zip(products, archived):
+            product.created_at = row["created_at"]
+        Product.objects.using(PRIMARY).bulk_update(products, ["created_at"])
+        ProductImage.objects.using(PRIMARY).bulk_create(
+            ProductImage(**row)
+            for row in ArchivedProductImage.objects.using(PRIMARY).filter(product_id__in=ids).values(*IMAGE_FIELDS)
+        )
+        ProductStats.objects.using(PRIMARY).bulk_create(
+            ProductStats(product_id=row["id"], views=row["views"])
+            for row in archived if row["views"]
+        )
+        _raw_delete(ArchivedProductImage.objects.filter(product_id__in=ids))
+        _raw_delete(ArchivedProduct.objects.filter(pk__in=ids))
+        invalidate(ProductStats)
+    return len(ids)
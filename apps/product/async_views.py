@@ -0,0 +1,212 @@
+"""
+Асинхронные варианты представлений для чтения - для запуска под ASGI.
+
+Работают рядом с синхронными (префикс async/), отдают те же ответы и
+используют те же ключи кеша: ORM через aget / async for, кеш через
+aget_or_build, пользователь через request.auser(). Синхронные
+представления под ASGI занимают поток на весь запрос, эти - нет.
+"""
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views import View
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+
+from apps.product.cache import aconditional_get, aget_or_build
+from apps.product.filters import active_filters, filter_products, filters_key, get_facets
+from apps.product.fragments import DETAIL_DEPENDS_ON, adetail_fragments, alist_fragments, join_fragments
+from apps.product.metrics import timed_serialization
+from apps.product.models import Book, Category, Models, Product, ProductImage
+from apps.product.pagination import KeysetPagination
+from apps.product.popularity import POPULAR_DEPENDS_ON, build_popular_list, popular_list_key, record_view
+from apps.product.serializers import (
+    BookSerializer, CategorySerializer, ModelsSerializer, ProductDetailSerializer,
+    ProductFilterSerializer, ProductSerializer,
+)
+from apps.product.sparse import sparse_key
+from core.db_router import replica_allowed, use_replica
+
+renderer = JSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(renderer.render(data), status=status, content_type="application/json")
+
+
+class AsyncReadView(View):
+    """
+    Базовое асинхронное представление только для чтения. Ошибки DRF
+    (неверный курсор, параметры) превращаются в такие же JSON-ответы, как у
+    синхронных представлений.
+    """
+    http_method_names = ["get", "head", "options"]
+
+    async def has_permission(self, request):
+        return True
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Пользователь загружается асинхронно - дальше request.user не
+        # обратится к сессии и базе из event loop.
+        request.user = await request.auser()
+        if not await self.has_permission(request):
+            return JsonResponse({"detail": "У вас недостаточно прав для выполнения данного действия."}, status=403)
+        try:
+            with use_replica() if replica_allowed(request) else nullcontext():
+                return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return json_response(exc.detail if isinstance(exc.detail, (dict, list)) else {"detail": exc.detail}, exc.status_code)
+        except Http404 as exc:
+            return JsonResponse({"detail": str(exc)}, status=404)
+
+
+class AsyncProductListView(AsyncReadView):
+    cache_depends_on = (Product, ProductImage)
+
+    async def get(self, request):
+        params = ProductFilterSerializer(data=request.GET)
+        params.is_valid(raise_exception=True)
+        if params.validated_data["ordering"] == "popular":
+            return await self.list_popular(request, params.validated_data)
+        return await self.list_newest(request, params.validated_data)
+
+    async def respond(self, request, paginator, data, filters, params):
+        extra = {"facets": await sync_to_async(get_facets)(filters)} if params["facets"] else None
+        return paginator.build_raw_response(request, data["results"], data["next_cursor"], extra=extra)
+
+    @aconditional_get(*cache_depends_on)
+    async def list_newest(self, request, params):
+        filters = active_filters(params)
+
+        paginator = KeysetPagination()
+        page_size = paginator.get_page_size(request)
+        cursor = request.GET.get(paginator.cursor_query_param, "")
+
+        async def build():
+            rows = filter_products(Product.objects.all(), filters)
+            rows = rows.values("id", "created_at", "updated_at")
+            page = await paginator.apaginate_queryset(rows, request)
+            results = join_fragments(await alist_fragments(page))
+            return {"results": results, "next_cursor": paginator.next_cursor}
+
+        async def build_sparse():
+            products = ProductSerializer.optimize_queryset(
+                filter_products(Product.objects.prefetch_related("images"), filters),
+                request, required=("created_at",),
+            )
+            page = await paginator.apaginate_queryset(products, request)
+            serializer = ProductSerializer(page, many=True, context={"sparse_request": request})
+            with timed_serialization():
+                results = renderer.render(serializer.data)
+            return {"results": results, "next_cursor": paginator.next_cursor}
+
+        fields = sparse_key(request)
+        data = await aget_or_build(
+            f"product_list:{page_size}:{cursor}:{filters_key(filters)}:{fields}",
+            build_sparse if fields else build,
+            depends_on=self.cache_depends_on,
+        )
+        return await self.respond(request, paginator, data, filters, params)
+
+    @aconditional_get(*POPULAR_DEPENDS_ON)
+    async def list_popular(self, request, params):
+        filters = active_filters(params)
+
+        paginator = KeysetPagination()
+        page_size = paginator.get_page_size(request)
+        cursor = request.GET.get(paginator.cursor_query_param, "")
+
+        # Рейтинг и фрагменты - те же, что у синхронной ленты; ключ кеша общий.
+        data = await aget_or_build(
+            popular_list_key(page_size, cursor, filters, sparse_key(request)),
+            sync_to_async(lambda: build_popular_list(request, filters, cursor, page_size)),
+            depends_on=POPULAR_DEPENDS_ON,
+        )
+        return await self.respond(request, paginator, data, filters, params)
+
+
+async def product_modified(uuid):
+    return await Product.objects.filter(uuid=uuid).values_list("updated_at", flat=True).afirst()
+
+
+class AsyncProductDetailView(AsyncReadView):
+    @aconditional_get(*DETAIL_DEPENDS_ON, row_modified=product_modified)
+    async def get(self, request, uuid):
+        if sparse_key(request):
+            queryset = ProductDetailSerializer.optimize_queryset(
+                Product.objects.select_related("category", "model").prefetch_related("images"),
+                request,
+            )
+            products = [product async for product in queryset.filter(uuid=uuid)]
+            if not products:
+                raise Http404("No Product matches the given query.")
+            record_view(uuid)
+            return json_response(ProductDetailSerializer(products[0], context={"sparse_request": request}).data)
+
+        fragment = (await adetail_fragments([uuid])).get(str(uuid))
+        if fragment is None:
+            raise Http404("No Product matches the given query.")
+        record_view(uuid)
+        return HttpResponse(fragment, content_type="application/json")
+
+
+class AsyncCachedListView(AsyncReadView):
+    """Асинхронная пара к CachedViewMixin - тот же ключ кеша и те же данные."""
+    queryset = None
+    serializer_class = None
+    cache_namespace = None
+    cache_depends_on = ()
+
+    async def get(self, request):
+        async def build():
+            queryset = self.serializer_class.optimize_queryset(self.queryset.all(), request)
+            objects = [obj async for obj in queryset]
+            with timed_serialization():
+                return self.serializer_class(objects, many=True, context={"request": request}).data
+
+        data = await aget_or_build(
+            f"{self.cache_namespace}_list:{sparse_key(request)}", build,
+            depends_on=self.cache_depends_on,
+        )
+        return json_response(data)
+
+
+class AsyncBookListView(AsyncCachedListView):
+    queryset = Book.objects.select_related("category")
+    serializer_class = BookSerializer
+    cache_namespace = "book"
+    cache_depends_on = (Book, Category)
+
+    get = aconditional_get(*cache_depends_on)(AsyncCachedListView.get)
+
+
+class AsyncBookDetailView(AsyncReadView):
+    cache_depends_on = (Book, Category)
+
+    @aconditional_get(*cache_depends_on)
+    async def get(self, request, pk):
+        queryset = BookSerializer.optimize_queryset(Book.objects.select_related("category"), request)
+        try:
+            book = await queryset.aget(pk=pk)
+        except Book.DoesNotExist:
+            raise Http404("No Book matches the given query.")
+        return json_response(BookSerializer(book, context={"request": request}).data)
+
+
+class AsyncCategoryListView(AsyncCachedListView):
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
+    cache_namespace = "category"
+    cache_depends_on = (Category,)
+
+    get = aconditional_get(*cache_depends_on)(AsyncCachedListView.get)
+
+
+class AsyncModelsListView(AsyncCachedListView):
+    queryset = Models.objects.select_related("category")
+    serializer_class = ModelsSerializer
+    cache_namespace = "models"
+    cache_depends_on = (Models, Category)
+
+    get = aconditional_get(*cache_depends_on)(AsyncCachedListView.get)
@@ -0,0 +1,355 @@
+"""
+Нагрузочные прогоны внутри процесса, без сети и внешнего сервера:
+WSGI-приложение вызывается из пула потоков, ASGI - из event loop.
+
+run_suite проходит по всем эндпоинтам чтения последовательно и считает
+задержку, пропускную способность, пик памяти и запросы к базе; результаты
+сохраняются в JSON и сравниваются с прошлым прогоном (compare).
+"""
+import asyncio
+import io
+import json
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from urllib.parse import quote, urlsplit
+
+HOST = "localhost"
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(latencies, elapsed, statuses):
+    return {
+        "requests": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "errors": sum(1 for status in statuses if status >= 400),
+    }
+
+
+def wsgi_environ(url):
+    parts = urlsplit(url)
+    return {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": parts.path,
+        "QUERY_STRING": parts.query,
+        "SERVER_NAME": HOST,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": HOST,
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+
+
+def wsgi_request(application, url):
+    status = []
+
+    def start_response(value, headers, exc_info=None):
+        status.append(int(value.split()[0]))
+
+    started = time.perf_counter()
+    result = application(wsgi_environ(url), start_response)
+    try:
+        for _ in result:
+            pass
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return time.perf_counter() - started, status[0]
+
+
+def run_wsgi(application, urls, concurrency):
+    """urls - список адресов, по запросу на каждый."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda url: wsgi_request(application, url), urls))
+    elapsed = time.perf_counter() - started
+    return summarize([r[0] for r in results], elapsed, [r[1] for r in results])
+
+
+async def asgi_request(application, url):
+    parts = urlsplit(url)
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": parts.path,
+        "raw_path": parts.path.encode(),
+        "query_string": parts.query.encode(),
+        "headers": [(b"host", HOST.encode())],
+        "server": (HOST, 80),
+        "client": ("127.0.0.1", 0),
+    }
+    sent = asyncio.Event()
+    status = []
+
+    async def receive():
+        if not status and not sent.is_set():
+            sent.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Клиент «не отключается», пока ответ не отправлен.
+        await asyncio.Future()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    started = time.perf_counter()
+    await application(scope, receive, send)
+    return time.perf_counter() - started, status[0]
+
+
+async def run_asgi(application, urls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(url):
+        async with semaphore:
+            return await asgi_request(application, url)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(url) for url in urls))
+    elapsed = time.perf_counter() - started
+    return summarize([r[0] for r in results], elapsed, [r[1] for r in results])
+
+
+# --- Набор эндпоинтов: задержка, пропускная способность, память и число
+# запросов к базе с холодным и прогретым кешем.
+
+API = "/api/v1/products/"
+MODES = ("cold", "warm")
+# Ухудшение p50 или пика памяти больше чем на столько считается
+# регрессией; для задержки ещё и не меньше чем на COMPARE_MIN_MS. p99 на
+# десятках запросов слишком шумный для сравнения - его держат бюджеты.
+COMPARE_THRESHOLD = 0.2
+COMPARE_MIN_MS = 2
+
+# Бюджеты: (запросов к базе не больше, p99 в мс не больше). Число запросов
+# не зависит от размера каталога и проверяется строго; задержка - с
+# запасом на шум, на каталоге из тестов и seed_catalog --size 1k. На
+# больших каталогах смотрят на сравнение с предыдущим прогоном.
+BUDGETS = {
+    "product-list": {"cold": (2, 250), "warm": (0, 100)},
+    "product-list-filtered": {"cold": (7, 500), "warm": (0, 100)},
+    "product-list-sparse": {"cold": (2, 250), "warm": (0, 100)},
+    "product-list-popular": {"cold": (3, 250), "warm": (0, 100)},
+    # Фрагменты адресуются по updated_at: один запрос даже с прогретым кешем.
+    "product-detail": {"cold": (4, 250), "warm": (2, 100)},
+    "product-batch": {"cold": (3, 500), "warm": (1, 100)},
+    "product-search": {"cold": (3, 250), "warm": (2, 100)},
+    "product-export": {"cold": (4, 2000), "warm": (4, 2000)},
+    "book-list": {"cold": (1, 1000), "warm": (0, 100)},
+    "book-detail": {"cold": (1, 250), "warm": (1, 100)},
+    "book-search": {"cold": (2, 250), "warm": (2, 100)},
+    "book-export": {"cold": (2, 2000), "warm": (2, 2000)},
+    "category-list": {"cold": (1, 250), "warm": (0, 100)},
+    "category-detail": {"cold": (1, 250), "warm": (1, 100)},
+    "models-list": {"cold": (1, 250), "warm": (0, 100)},
+    "models-detail": {"cold": (1, 250), "warm": (1, 100)},
+    "async-product-list": {"cold": (2, 250), "warm": (0, 100)},
+    "async-product-detail": {"cold": (4, 250), "warm": (2, 100)},
+    "async-book-list": {"cold": (1, 1000), "warm": (0, 100)},
+    "async-book-detail": {"cold": (1, 250), "warm": (1, 100)},
+    "async-category-list": {"cold": (1, 250), "warm": (0, 100)},
+    "async-models-list": {"cold": (1, 250), "warm": (0, 100)},
+}
+
+
+def endpoints():
+    """
+    Эндпоинты чтения из apps/product/urls.py с адресами на реальные записи.
+    POST products/batch/ тоже только читает и входит в набор; создание,
+    импорт, массовое обновление и сброс пароля меняют данные и не меряются.
+    """
+    from apps.product.models import Book, Category, Models, Product
+
+    product = Product.objects.order_by("pk").values("uuid", "category_id").first()
+    uuids = [str(u) for u in Product.objects.order_by("pk").values_list("uuid", flat=True)[:50]]
+    book_id = Book.objects.order_by("pk").values_list("pk", flat=True).first()
+    category_id = Category.objects.order_by("pk").values_list("pk", flat=True).first()
+    models_id = Models.objects.order_by("pk").values_list("pk", flat=True).first()
+    if not (product and book_id and models_id):
+        raise ValueError("Каталог пуст - сначала выполните seed_catalog.")
+
+    batch = json.dumps({"uuids": uuids}).encode()
+    return [
+        ("product-list", "GET", "products/", None),
+        ("product-list-filtered", "GET", f"products/?category={product['category_id']}&facets=true", None),
+        ("product-list-sparse", "GET", "products/?fields=uuid,title,price", None),
+        ("product-list-popular", "GET", "products/?ordering=popular", None),
+        ("product-detail", "GET", f"products/{product['uuid']}/", None),
+        ("product-batch", "POST", "products/batch/", batch),
+        ("product-search", "GET", "products/search/?q=" + quote("кроссовки"), None),
+        ("product-export", "GET", "products/export/", None),
+        ("book-list", "GET", "books/", None),
+        ("book-detail", "GET", f"books/{book_id}/", None),
+        ("book-search", "GET", "books/search/?q=" + quote("куртка"), None),
+        ("book-export", "GET", "books/export/", None),
+        ("category-list", "GET", "categories/", None),
+        ("category-detail", "GET", f"categories/{category_id}/", None),
+        ("models-list", "GET", "models/", None),
+        ("models-detail", "GET", f"models/{models_id}/", None),
+        ("async-product-list", "GET", "async/products/", None),
+        ("async-product-detail", "GET", f"async/products/{product['uuid']}/", None),
+        ("async-book-list", "GET", "async/books/", None),
+        ("async-book-detail", "GET", f"async/books/{book_id}/", None),
+        ("async-category-list", "GET", "async/categories/", None),
+        ("async-models-list", "GET", "async/models/", None),
+    ]
+
+
+def reset_caches():
+    from django.core.cache import cache
+
+    from apps.product.cache import clear_local
+
+    cache.clear()
+    clear_local()
+
+
+class QueryCounter:
+    """Считает запросы на всех подключениях (основная база и реплика)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def capture(self):
+        from django.db import connections
+
+        self.count = 0
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+
+def call(application, method, url, body):
+    """Один запрос к WSGI-приложению; ответ дочитывается целиком (и потоковый)."""
+    environ = wsgi_environ(API + url)
+    environ["REQUEST_METHOD"] = method
+    if body is not None:
+        environ["wsgi.input"] = io.BytesIO(body)
+        environ["CONTENT_TYPE"] = "application/json"
+        environ["CONTENT_LENGTH"] = str(len(body))
+    status = []
+
+    def start_response(value, headers, exc_info=None):
+        status.append(int(value.split()[0]))
+
+    size = 0
+    started = time.perf_counter()
+    result = application(environ, start_response)
+    try:
+        for chunk in result:
+            size += len(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return time.perf_counter() - started, status[0], size
+
+
+def measure(application, endpoint, mode, requests):
+    name, method, url, body = endpoint
+    counter = QueryCounter()
+    if mode == "warm":
+        call(application, method, url, body)
+
+    latencies, statuses, queries = [], [], 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        if mode == "cold":
+            reset_caches()
+        with counter.capture():
+            latency, status, size = call(application, method, url, body)
+        latencies.append(latency)
+        statuses.append(status)
+        queries = max(queries, counter.count)
+    elapsed = time.perf_counter() - started
+
+    # Пик памяти - отдельным запросом: tracemalloc заметно замедляет код.
+    if mode == "cold":
+        reset_caches()
+    tracemalloc.start()
+    try:
+        call(application, method, url, body)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    row = summarize(latencies, elapsed, statuses)
+    row.update(queries=queries, peak_kb=round(peak / 1024, 1), bytes=size)
+    return row
+
+
+def run_suite(application, requests=50, only=None):
+    from django.test.utils import override_settings
+
+    from apps.product.models import Book, Product
+    from apps.product.popularity import flush_views
+
+    results = {}
+    # Просмотры пишутся между эндпоинтами, а не посреди замера чужого запроса.
+    with override_settings(POPULARITY_FLUSH_INTERVAL=float("inf")):
+        for endpoint in endpoints():
+            if only and endpoint[0] not in only:
+                continue
+            results[endpoint[0]] = {mode: measure(application, endpoint, mode, requests) for mode in MODES}
+            flush_views()
+    return {
+        "catalog": {"products": Product.objects.count(), "books": Book.objects.count()},
+        "requests": requests,
+        "endpoints": results,
+    }
+
+
+def check_budgets(report, budgets=BUDGETS):
+    problems = []
+    for name, modes in report["endpoints"].items():
+        for mode, row in modes.items():
+            if row["errors"]:
+                problems.append(f"{name} ({mode}): ответов с ошибкой {row['errors']}")
+            if name not in budgets:
+                continue
+            max_queries, max_p99 = budgets[name][mode]
+            if row["queries"] > max_queries:
+                problems.append(f"{name} ({mode}): {row['queries']} запросов к базе, бюджет {max_queries}")
+            if row["p99_ms"] > max_p99:
+                problems.append(f"{name} ({mode}): p99 {row['p99_ms']} мс, бюджет {max_p99} мс")
+    return problems
+
+
+def compare(baseline, report, threshold=COMPARE_THRESHOLD):
+    """Ухудшения относительно прошлого прогона: (эндпоинт, режим, метрика, было, стало)."""
+    regressions = []
+    for name, modes in report["endpoints"].items():
+        for mode, row in modes.items():
+            old = baseline.get("endpoints", {}).get(name, {}).get(mode)
+            if old is None:
+                continue
+            if row["queries"] > old["queries"]:
+                regressions.append((name, mode, "queries", old["queries"], row["queries"]))
+            for metric, floor in (("p50_ms", COMPARE_MIN_MS), ("peak_kb", 0)):
+                if row[metric] > old[metric] * (1 + threshold) and row[metric] - old[metric] > floor:
+                    regressions.append((name, mode, metric, old[metric], row[metric]))
+    return regressions
@@ -0,0 +1,127 @@
+from django.db import transaction
+
+from apps.product.cache import defer_invalidation
+from apps.product.models import Category, Models, Product
+from apps.product.serializers import ProductBulkUpdateItemSerializer
+
+UPDATE_FIELDS = ("price", "is_active", "size", "category", "model")
+RELATED_FIELDS = {"category": Category, "model": Models}
+
+
+class ProductBulkUpdater:
+    """
+    Массовое изменение товаров (цена, активность, размер, категория, модель).
+
+    Все строки проверяются заранее: товары, категории и модели читаются
+    тремя запросами на весь список. При любой ошибке ничего не меняется.
+    Изменения пишутся через bulk_update в одной транзакции, кеш
+    инвалидируется один раз.
+    """
+    batch_size = 500
+
+    def __init__(self, items, dry_run=False):
+        self.items = items
+        self.dry_run = dry_run
+        self.results = []
+        self.changed = []
+        self.fields = set()
+
+    def run(self):
+        with transaction.atomic(), defer_invalidation():
+            self.check_rows(self.parse_rows())
+            if self.changed and not self.failed and not self.dry_run:
+                Product.objects.bulk_update(
+                    self.changed, sorted(self.fields), batch_size=self.batch_size
+                )
+        return self.report()
+
+    @property
+    def failed(self):
+        return sum(1 for result in self.results if result["status"] == "error")
+
+    def report(self):
+        updated = sum(1 for result in self.results if result["status"] == "updated")
+        return {
+            "dry_run": self.dry_run,
+            "applied": not self.dry_run and not self.failed,
+            "updated": updated,
+            "unchanged": len(self.results) - updated - self.failed,
+            "failed": self.failed,
+            "results": sorted(self.results, key=lambda result: result["row"]),
+        }
+
+    def add_result(self, row, uuid, status, **extra):
+        self.results.append({"row": row, "uuid": uuid and str(uuid), "status": status, **extra})
+
+    def parse_rows(self):
+        rows = []
+        for row, item in enumerate(self.items, start=1):
+            serializer = ProductBulkUpdateItemSerializer(data=item)
+            if serializer.is_valid():
+                rows.append((row, serializer.validated_data))
+            else:
+                self.add_result(row, item.get("uuid"), "error", errors=serializer.errors)
+        return rows
+
+    def check_rows(self, rows):
+        products = (
+            Product.objects.select_for_update()
+            .in_bulk([data["uuid"] for _, data in rows], field_name="uuid")
+        )
+        ids = {
+            name: {data[name] for _, data in rows if data.get(name) is not None}
+            for name in RELATED_FIELDS
+        }
+        # При смене одной категории нужна и текущая модель товара.
+        ids["model"].update(
+            products[data["uuid"]].model_id for _, data in rows
+            if "category" in data and "model" not in data and data["uuid"] in products
+        )
+        ids["model"].discard(None)
+        related = {
+            name: model.objects.in_bulk(ids[name])
+            for name, model in RELATED_FIELDS.items()
+        }
+
+        seen = set()
+        for row, data in rows:
+            uuid = data["uuid"]
+            product = products.get(uuid)
+            errors = {}
+            if uuid in seen:
+                errors["uuid"] = ["Товар указан несколько раз."]
+            elif product is None:
+                errors["uuid"] = ["Товар не найден."]
+            seen.add(uuid)
+            if "category" in data and data["category"] is not None and data["category"] not in related["category"]:
+                errors["category"] = ["Категория не найдена."]
+            if "model" in data and data["model"] is not None and data["model"] not in related["model"]:
+                errors["model"] = ["Модель не найдена."]
+            if errors:
+                self.add_result(row, uuid, "error", errors=errors)
+                continue
+
+            category_id = data.get("category", product.category_id)
+            model = related["model"].get(data.get("model", product.model_id))
+            if model and category_id and model.category_id != category_id:
+                self.add_result(row, uuid, "error", errors={
+                    "non_field_errors": ["Модель не принадлежит выбранной категории!"],
+                })
+                continue
+
+            changes = self.apply(product, data)
+            self.add_result(row, uuid, "updated" if changes else "unchanged", changes=changes)
+
+    def apply(self, product, data):
+        changes = {}
+        for name in UPDATE_FIELDS:
+            if name not in data:
+                continue
+            attname = f"{name}_id" if name in RELATED_FIELDS else name
+            if getattr(product, attname) != data[name]:
+                setattr(product, attname, data[name])
+                changes[name] = data[name]
+        if changes:
+            self.changed.append(product)
+            self.fields.update(changes)
+        return changes
@@ -0,0 +1,428 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+from rest_framework.response import Response
+
+from apps.product.metrics import record_cache_event, timed_serialization
+from apps.product.sparse import sparse_key
+from core.db_router import use_primary
+
+
+def namespace_for(model):
+    if isinstance(model, str):
+        return model
+    return model._meta.model_name
+
+
+def version_key(namespace):
+    return f"{namespace}:version"
+
+
+class LocalLRU:
+    """Небольшой LRU в памяти процесса (L1) перед общим кешем (L2)."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                return self._data[key]
+            except KeyError:
+                return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalLRU(settings.CACHE_L1_MAX_ENTRIES)
+# namespace -> (версия, время изменения, время последней сверки с L2)
+_local_versions = {}
+
+
+def clear_local():
+    """Сбрасывает L1 и сверенные версии этого процесса (после очистки L2)."""
+    local_cache.clear()
+    _local_versions.clear()
+
+
+def modified_key(namespace):
+    return f"{namespace}:modified"
+
+
+def get_version(namespace):
+    return get_versions([namespace])[0]
+
+
+def _outdated(namespaces, now):
+    interval = settings.CACHE_VERSION_CHECK_INTERVAL
+    return [
+        ns for ns in namespaces
+        if ns not in _local_versions or now - _local_versions[ns][2] >= interval
+    ]
+
+
+def _refresh_versions(namespaces):
+    now = time.time()
+    outdated = _outdated(namespaces, now)
+    if not outdated:
+        return
+
+    keys = [version_key(ns) for ns in outdated] + [modified_key(ns) for ns in outdated]
+    found = cache.get_many(keys)
+    for namespace in outdated:
+        version = found.get(version_key(namespace))
+        if version is None:
+            # Стартуем с текущего времени, чтобы после вытеснения ключа
+            # версия не вернулась к старому значению.
+            cache.add(version_key(namespace), int(now * 1000), timeout=None)
+            version = cache.get(version_key(namespace))
+        modified = found.get(modified_key(namespace))
+        if modified is None:
+            modified = now
+            cache.add(modified_key(namespace), modified, timeout=None)
+        _local_versions[namespace] = (version, modified, now)
+
+
+def get_versions(namespaces):
+    """
+    Версии пространств имён. Сверка с L2 идёт не чаще, чем раз в
+    CACHE_VERSION_CHECK_INTERVAL секунд, поэтому большинство попаданий в L1
+    вообще не обращаются к общему кешу.
+    """
+    _refresh_versions(namespaces)
+    return tuple(_local_versions[ns][0] for ns in namespaces)
+
+
+def _last_modified(namespaces):
+    timestamp = max(_local_versions[ns][1] for ns in namespaces)
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+def get_last_modified(namespaces):
+    _refresh_versions(namespaces)
+    return _last_modified(namespaces)
+
+
+async def _arefresh_versions(namespaces):
+    # Сверка с L2 нужна редко, в остальное время версии берутся из памяти
+    # без переключения в поток.
+    if _outdated(namespaces, time.time()):
+        await sync_to_async(_refresh_versions)(namespaces)
+
+
+async def aget_versions(namespaces):
+    await _arefresh_versions(namespaces)
+    return tuple(_local_versions[ns][0] for ns in namespaces)
+
+
+async def aget_last_modified(namespaces):
+    await _arefresh_versions(namespaces)
+    return _last_modified(namespaces)
+
+
+def bump_version(*namespaces):
+    for namespace in namespaces:
+        key = version_key(namespace)
+        try:
+            version = cache.incr(key)
+        except ValueError:
+            # Ключ вытеснен из L2: сверенная локальная версия уже не в счёт.
+            _local_versions.pop(namespace, None)
+            get_versions([namespace])
+            version = cache.incr(key)
+        now = time.time()
+        cache.set(modified_key(namespace), now, timeout=None)
+        _local_versions[namespace] = (version, now, now)
+
+
+_deferred = threading.local()
+
+
+def invalidate(*models):
+    """
+    Поднимает версии моделей после коммита текущей транзакции, чтобы
+    никто не успел закешировать под новой версией ещё не закоммиченные данные.
+    """
+    namespaces = {namespace_for(model) for model in models}
+    pending = getattr(_deferred, "pending", None)
+    if pending is not None:
+        pending.update(namespaces)
+        return
+    transaction.on_commit(lambda: bump_version(*sorted(namespaces)))
+
+
+@contextmanager
+def defer_invalidation():
+    """Схлопывает все инвалидации внутри блока в одну на пространство имён."""
+    if getattr(_deferred, "pending", None) is not None:
+        yield
+        return
+    _deferred.pending = set()
+    try:
+        yield
+    finally:
+        pending, _deferred.pending = _deferred.pending, None
+        if pending:
+            invalidate(*pending)
+
+
+stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def count_events(namespace, event, count=1):
+    """Учитывает события кеша (и те, что идут мимо get_or_build)."""
+    if not count:
+        return
+    with _stats_lock:
+        stats[(namespace, event)] += count
+    record_cache_event(namespace, event, count)
+
+
+def _count(key, event):
+    count_events(key.split(":", 1)[0], event)
+
+
+def get_or_build(key, builder, depends_on, soft_ttl=None, hard_ttl=None, lock_ttl=None):
+    """
+    Двухуровневый кеш с перестройкой в один поток.
+
+    L1 отдаёт значение без обращения к L2, пока версии depends_on не
+    изменились и не прошёл soft_ttl. В L2 запись свежая при тех же условиях;
+    устаревшую запись перестраивает только запрос, взявший блокировку,
+    остальные до hard_ttl отдают старое значение.
+
+    builder читает основную базу, даже если запрос читает реплику: сразу
+    после записи версия уже поднята, а отстающая реплика отдала бы старые
+    данные, и они закешировались бы под новой версией.
+
+    Возвращаемое значение общее для всех запросов процесса - его нельзя менять.
+    """
+    soft_ttl = soft_ttl or settings.CACHE_SOFT_TTL
+    hard_ttl = hard_ttl or settings.CACHE_HARD_TTL
+    lock_ttl = lock_ttl or settings.CACHE_REBUILD_LOCK_TTL
+    version = get_versions([namespace_for(model) for model in depends_on])
+    now = time.time()
+
+    entry = local_cache.get(key)
+    if entry is not None and entry["version"] == version and now < entry["fresh_until"]:
+        _count(key, "local_hit")
+        return entry["value"]
+
+    lock_key = f"{key}:lock"
+    entry = cache.get(key)
+
+    if entry is not None:
+        if entry["version"] == version and now < entry["fresh_until"]:
+            _count(key, "hit")
+            local_cache.set(key, entry)
+            return entry["value"]
+        owns_lock = cache.add(lock_key, 1, timeout=lock_ttl)
+        if not owns_lock:
+            _count(key, "stale")
+            return entry["value"]
+    else:
+        _count(key, "miss")
+        owns_lock = cache.add(lock_key, 1, timeout=lock_ttl)
+        if not owns_lock:
+            entry = _wait_for_entry(key, version, lock_ttl)
+            if entry is not None:
+                local_cache.set(key, entry)
+                return entry["value"]
+
+    try:
+        with use_primary():
+            value = builder()
+        entry = {
+            "value": value,
+            "version": version,
+            "fresh_until": time.time() + soft_ttl,
+        }
+        cache.set(key, entry, timeout=hard_ttl)
+        local_cache.set(key, entry)
+        _count(key, "rebuild")
+        return entry["value"]
+    finally:
+        # Не дождались чужой перестройки - строим сами, но чужую
+        # блокировку не снимаем, иначе следом начнёт строить третий.
+        if owns_lock:
+            cache.delete(lock_key)
+
+
+def _wait_for_entry(key, version, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and entry["version"] == version:
+            return entry
+    return None
+
+
+async def aget_or_build(key, builder, depends_on, soft_ttl=None, hard_ttl=None, lock_ttl=None):
+    """Асинхронный get_or_build: builder - корутина, кеш читается через aget."""
+    soft_ttl = soft_ttl or settings.CACHE_SOFT_TTL
+    hard_ttl = hard_ttl or settings.CACHE_HARD_TTL
+    lock_ttl = lock_ttl or settings.CACHE_REBUILD_LOCK_TTL
+    version = await aget_versions([namespace_for(model) for model in depends_on])
+    now = time.time()
+
+    entry = local_cache.get(key)
+    if entry is not None and entry["version"] == version and now < entry["fresh_until"]:
+        _count(key, "local_hit")
+        return entry["value"]
+
+    lock_key = f"{key}:lock"
+    entry = await cache.aget(key)
+
+    if entry is not None:
+        if entry["version"] == version and now < entry["fresh_until"]:
+            _count(key, "hit")
+            local_cache.set(key, entry)
+            return entry["value"]
+        owns_lock = await cache.aadd(lock_key, 1, timeout=lock_ttl)
+        if not owns_lock:
+            _count(key, "stale")
+            return entry["value"]
+    else:
+        _count(key, "miss")
+        owns_lock = await cache.aadd(lock_key, 1, timeout=lock_ttl)
+        if not owns_lock:
+            deadline = time.time() + lock_ttl
+            while time.time() < deadline:
+                await asyncio.sleep(0.05)
+                entry = await cache.aget(key)
+                if entry is not None and entry["version"] == version:
+                    local_cache.set(key, entry)
+                    return entry["value"]
+
+    try:
+        with use_primary():
+            value = await builder()
+        entry = {
+            "value": value,
+            "version": version,
+            "fresh_until": time.time() + soft_ttl,
+        }
+        await cache.aset(key, entry, timeout=hard_ttl)
+        local_cache.set(key, entry)
+        _count(key, "rebuild")
+        return entry["value"]
+    finally:
+        if owns_lock:
+            await cache.adelete(lock_key)
+
+
+def _validators(request, versions, modified, row):
+    if row is not None:
+        modified = max(modified, row)
+    raw = repr((request.get_full_path(), versions, row and row.isoformat()))
+    return hashlib.md5(raw.encode()).hexdigest(), modified
+
+
+def conditional_get(*depends_on, row_modified=None):
+    """
+    ETag и Last-Modified по версиям depends_on без обращения к данным.
+
+    Если ответ зависит от конкретной строки, row_modified(*args, **kwargs)
+    возвращает её updated_at (None - строки нет, условный ответ не строится).
+    При совпадении If-None-Match / If-Modified-Since представление не
+    вызывается вовсе и клиент получает 304.
+    """
+    namespaces = [namespace_for(model) for model in depends_on]
+
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, "_cache_validators"):
+            row = row_modified(*args, **kwargs) if row_modified else None
+            if row_modified and row is None:
+                request._cache_validators = (None, None)
+            else:
+                request._cache_validators = _validators(
+                    request, get_versions(namespaces), get_last_modified(namespaces), row
+                )
+        return request._cache_validators
+
+    return condition(
+        etag_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[1],
+    )
+
+
+def aconditional_get(*depends_on, row_modified=None):
+    """
+    conditional_get для асинхронных методов представлений; row_modified -
+    корутина. Декоратор condition() вызывает валидаторы синхронно, а им
+    может понадобиться ORM, поэтому условный ответ строится здесь.
+    """
+    namespaces = [namespace_for(model) for model in depends_on]
+
+    def decorator(method):
+        @wraps(method)
+        async def wrapper(view, request, *args, **kwargs):
+            row = await row_modified(*args, **kwargs) if row_modified else None
+            if row_modified and row is None:
+                return await method(view, request, *args, **kwargs)
+
+            etag, modified = _validators(
+                request, await aget_versions(namespaces),
+                await aget_last_modified(namespaces), row,
+            )
+            etag = quote_etag(etag)
+            last_modified = int(modified.timestamp())
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await method(view, request, *args, **kwargs)
+                if response.status_code == 200:
+                    response.headers.setdefault("Last-Modified", http_date(last_modified))
+                    response.headers.setdefault("ETag", etag)
+            return response
+        return wrapper
+    return decorator
+
+
+class CachedViewMixin:
+    """
+    Кеширует list() generic-представлений через get_or_build.
+
+    cache_depends_on - модели, от которых зависит ответ; их изменение
+    инвалидирует кеш через сигналы (см. apps/product/signals.py).
+    """
+    cache_namespace = None
+    cache_depends_on = ()
+
+    def list(self, request, *args, **kwargs):
+        def build():
+            queryset = self.filter_queryset(self.get_queryset())
+            with timed_serialization():
+                return self.get_serializer(queryset, many=True).data
+
+        data = get_or_build(
+            f"{self.cache_namespace}_list:{sparse_key(request)}", build,
+            depends_on=self.cache_depends_on,
+        )
+        return Response(data)
@@ -0,0 +1,21 @@
+# Чистые функции Pillow без Django: модуль импортируется в дочерних
+# процессах пула, где Django не настроен.
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+
+def render_derivatives(path, thumbnail_size, webp_max_size, quality):
+    """Возвращает (JPEG-миниатюра фиксированного размера, сжатый WebP)."""
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+
+    thumbnail = ImageOps.fit(image, thumbnail_size, Image.Resampling.LANCZOS)
+    thumbnail_buffer = BytesIO()
+    thumbnail.save(thumbnail_buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+
+    image.thumbnail(webp_max_size, Image.Resampling.LANCZOS)
+    webp_buffer = BytesIO()
+    image.save(webp_buffer, "WEBP", quality=quality, method=6)
+
+    return thumbnail_buffer.getvalue(), webp_buffer.getvalue()
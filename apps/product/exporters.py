@@ -0,0 +1,109 @@
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.renderers import BaseRenderer
+
+from apps.product.models import Book, Product, ProductImage
+from apps.product.pagination import decode_cursor, encode_cursor
+
+PRODUCT_EXPORT_FIELDS = (
+    "id", "uuid", "title", "description", "price", "size", "is_active",
+    "category_id", "model_id", "created_at", "updated_at",
+)
+BOOK_EXPORT_FIELDS = (
+    "id", "title", "author", "description", "price", "published_date",
+    "category_id", "created_at",
+)
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Выгрузка отдаётся потоком мимо рендерера, сюда попадают только ошибки.
+        return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode() + b"\n"
+
+
+class CSVRenderer(NDJSONRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+def export_records(queryset, fields, cursor=None, chunk_size=2000, attach=None):
+    """
+    Записи по возрастанию (created_at, id) с курсором для продолжения.
+
+    Читает через iterator() пачками по chunk_size, attach(records) дополняет
+    пачку одним запросом - память не зависит от размера каталога.
+    """
+    queryset = queryset.order_by("created_at", "id")
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__gte=created_at),
+            Q(created_at__gt=created_at) | Q(id__gt=pk),
+        )
+
+    rows = queryset.values(*fields).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        if attach:
+            attach(chunk)
+        for record in chunk:
+            record["cursor"] = encode_cursor(record["created_at"], record["id"])
+            yield record
+
+
+def attach_product_images(records):
+    storage = ProductImage._meta.get_field("image").storage
+    images = defaultdict(list)
+    rows = (
+        ProductImage.objects
+        .filter(product_id__in=[record["id"] for record in records])
+        .order_by("product_id", "pk")
+        .values_list("product_id", "image")
+    )
+    for product_id, name in rows:
+        images[product_id].append(storage.url(name))
+    for record in records:
+        record["images"] = images[record["id"]]
+
+
+def export_products(cursor=None):
+    return export_records(
+        Product.objects.all(), PRODUCT_EXPORT_FIELDS,
+        cursor=cursor, attach=attach_product_images,
+    )
+
+
+def export_books(cursor=None):
+    return export_records(Book.objects.all(), BOOK_EXPORT_FIELDS, cursor=cursor)
+
+
+def stream_ndjson(records):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for record in records:
+        yield encoder.encode(record) + "\n"
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(records, fields):
+    columns = [*fields, "cursor"]
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for record in records:
+        if isinstance(record.get("images"), list):
+            record["images"] = "|".join(record["images"])
+        yield writer.writerow([record.get(column) for column in columns])
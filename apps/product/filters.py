@@ -0,0 +1,72 @@
+from django.db.models import Count, Max, Min
+
+from apps.product.cache import get_or_build
+from apps.product.models import Product
+
+# параметр запроса -> lookup
+FILTER_LOOKUPS = {
+    "category": "category_id",
+    "model": "model_id",
+    "size": "size",
+    "price_min": "price__gte",
+    "price_max": "price__lte",
+    "is_active": "is_active",
+}
+# фасет -> поле группировки
+FACET_FIELDS = {
+    "category": "category_id",
+    "model": "model_id",
+    "size": "size",
+    "is_active": "is_active",
+}
+
+
+def active_filters(params):
+    return {
+        name: params[name] for name in FILTER_LOOKUPS
+        if params.get(name) is not None
+    }
+
+
+def filters_key(filters):
+    return ",".join(f"{name}={filters[name]}" for name in sorted(filters))
+
+
+def filter_products(queryset, filters):
+    return queryset.filter(**{FILTER_LOOKUPS[name]: value for name, value in filters.items()})
+
+
+def compute_facets(filters):
+    """
+    Счётчики по значениям фасетов. Для каждого фасета применяются все
+    фильтры, кроме его собственного, - так видно, сколько товаров даст
+    выбор другого значения.
+    """
+    facets = {}
+    for facet, field in FACET_FIELDS.items():
+        others = {name: value for name, value in filters.items() if name != facet}
+        rows = (
+            filter_products(Product.objects.all(), others)
+            .values(field)
+            .annotate(count=Count("id"))
+            .order_by(field)
+        )
+        facets[facet] = [{"value": row[field], "count": row["count"]} for row in rows]
+
+    others = {
+        name: value for name, value in filters.items()
+        if name not in ("price_min", "price_max")
+    }
+    facets["price"] = filter_products(Product.objects.all(), others).aggregate(
+        min=Min("price"), max=Max("price")
+    )
+    return facets
+
+
+def get_facets(filters):
+    """Счётчики кешируются и сбрасываются при любом изменении товаров."""
+    return get_or_build(
+        f"product_facets:{filters_key(filters)}",
+        lambda: compute_facets(filters),
+        depends_on=(Product,),
+    )
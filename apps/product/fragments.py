@@ -0,0 +1,150 @@
+"""
+Заранее отрендеренные JSON-фрагменты товаров.
+
+Ключ фрагмента содержит updated_at товара, который меняется при любом
+изменении товара или его фото, поэтому фрагмент перестраивается только для
+изменившихся товаров. Ответ-список склеивается из готовых байтов без
+сериализации. Недостающие фрагменты строятся по основной базе: ключ может
+прийти с отстающей реплики, но в кеш не попадёт содержимое старше ключа.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from apps.product.cache import aget_versions, count_events, get_versions, namespace_for
+from apps.product.metrics import timed_serialization
+from apps.product.models import Category, Models, Product
+from apps.product.serializers import (
+    ProductDetailSerializer, product_list_rows, product_list_values,
+)
+from core.db_router import PRIMARY
+
+# Кроме самого товара детальное представление показывает названия
+# категории и модели.
+DETAIL_DEPENDS_ON = (Category, Models)
+
+renderer = JSONRenderer()
+
+FRAGMENT_NAMESPACE = "product_fragment"
+
+
+def _stamp(updated_at):
+    return updated_at.timestamp()
+
+
+def list_fragment_key(pk, updated_at):
+    return f"{FRAGMENT_NAMESPACE}:list:{pk}:{_stamp(updated_at)}"
+
+
+def detail_fragment_key(uuid, updated_at, versions):
+    suffix = ":".join(str(v) for v in versions)
+    return f"{FRAGMENT_NAMESPACE}:detail:{uuid}:{_stamp(updated_at)}:{suffix}"
+
+
+def _count_fragments(total, missing):
+    count_events(FRAGMENT_NAMESPACE, "hit", total - len(missing))
+    count_events(FRAGMENT_NAMESPACE, "miss", len(missing))
+
+
+def _list_keys(rows):
+    return [list_fragment_key(row["id"], row["updated_at"]) for row in rows]
+
+
+def _list_missing_queryset(missing):
+    return product_list_values(Product.objects.using(PRIMARY).filter(pk__in=missing))
+
+
+def _render_list(missing, values):
+    values = list(values)
+    with timed_serialization():
+        return {missing[data["id"]]: renderer.render(data) for data in product_list_rows(values)}
+
+
+def list_fragments(rows):
+    """Фрагменты списка для строк с id и updated_at, в порядке строк."""
+    keys = _list_keys(rows)
+    fragments = cache.get_many(keys)
+
+    missing = {row["id"]: key for row, key in zip(rows, keys) if key not in fragments}
+    _count_fragments(len(keys), missing)
+    if missing:
+        built = _render_list(missing, _list_missing_queryset(missing))
+        cache.set_many(built, timeout=settings.PRODUCT_FRAGMENT_TTL)
+        fragments.update(built)
+
+    return [fragments[key] for key in keys if key in fragments]
+
+
+async def alist_fragments(rows):
+    keys = _list_keys(rows)
+    fragments = await cache.aget_many(keys)
+
+    missing = {row["id"]: key for row, key in zip(rows, keys) if key not in fragments}
+    _count_fragments(len(keys), missing)
+    if missing:
+        values = [row async for row in _list_missing_queryset(missing)]
+        built = _render_list(missing, values)
+        await cache.aset_many(built, timeout=settings.PRODUCT_FRAGMENT_TTL)
+        fragments.update(built)
+
+    return [fragments[key] for key in keys if key in fragments]
+
+
+def _detail_keys(rows, versions):
+    return {str(uuid): detail_fragment_key(uuid, updated_at, versions) for uuid, updated_at in rows}
+
+
+def _detail_missing_queryset(missing):
+    return (
+        Product.objects.using(PRIMARY).filter(uuid__in=missing)
+        .select_related("category", "model")
+        .prefetch_related("images")
+    )
+
+
+def _render_detail(keys, products):
+    products = list(products)
+    with timed_serialization():
+        return {
+            keys[str(product.uuid)]: renderer.render(ProductDetailSerializer(product).data)
+            for product in products
+        }
+
+
+DETAIL_NAMESPACES = [namespace_for(model) for model in DETAIL_DEPENDS_ON]
+
+
+def detail_fragments(uuids):
+    """Словарь str(uuid) -> фрагмент детального представления."""
+    rows = Product.objects.filter(uuid__in=uuids).values_list("uuid", "updated_at")
+    keys = _detail_keys(rows, get_versions(DETAIL_NAMESPACES))
+    fragments = cache.get_many(keys.values())
+
+    missing = [uuid for uuid, key in keys.items() if key not in fragments]
+    _count_fragments(len(keys), missing)
+    if missing:
+        built = _render_detail(keys, _detail_missing_queryset(missing))
+        cache.set_many(built, timeout=settings.PRODUCT_FRAGMENT_TTL)
+        fragments.update(built)
+
+    return {uuid: fragments[key] for uuid, key in keys.items() if key in fragments}
+
+
+async def adetail_fragments(uuids):
+    rows = [row async for row in Product.objects.filter(uuid__in=uuids).values_list("uuid", "updated_at")]
+    keys = _detail_keys(rows, await aget_versions(DETAIL_NAMESPACES))
+    fragments = await cache.aget_many(keys.values())
+
+    missing = [uuid for uuid, key in keys.items() if key not in fragments]
+    _count_fragments(len(keys), missing)
+    if missing:
+        products = [product async for product in _detail_missing_queryset(missing)]
+        built = _render_detail(keys, products)
+        await cache.aset_many(built, timeout=settings.PRODUCT_FRAGMENT_TTL)
+        fragments.update(built)
+
+    return {uuid: fragments[key] for uuid, key in keys.items() if key in fragments}
+
+
+def join_fragments(fragments):
+    return b"[" + b",".join(fragments) + b"]"
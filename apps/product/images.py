@@ -0,0 +1,109 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.product.derivatives import render_derivatives
+from apps.product.models import ArchivedProductImage, Product, ProductImage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELDS = ("image", "thumbnail", "webp")
+
+_pool = None
+# Один поток-диспетчер: читает записи, отдаёт Pillow в пул процессов и
+# сохраняет результат. Запросы его не ждут.
+_dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="product-images")
+
+
+def get_pool(workers=None):
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=workers or settings.PRODUCT_IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def render_options():
+    return (
+        settings.PRODUCT_THUMBNAIL_SIZE,
+        settings.PRODUCT_WEBP_MAX_SIZE,
+        settings.PRODUCT_IMAGE_QUALITY,
+    )
+
+
+def schedule_derivatives(image_ids):
+    """Ставит построение производных в очередь после коммита транзакции."""
+    image_ids = list(image_ids)
+    if not image_ids:
+        return
+    if not settings.PRODUCT_IMAGE_WORKERS:
+        transaction.on_commit(lambda: generate_derivatives(image_ids))
+        return
+    transaction.on_commit(lambda: _dispatcher.submit(_run_in_background, image_ids))
+
+
+def _run_in_background(image_ids):
+    try:
+        generate_derivatives(image_ids, pool=get_pool())
+    except Exception:
+        logger.exception("Не удалось построить превью для фото %s", image_ids)
+    finally:
+        close_old_connections()
+
+
+def generate_derivatives(image_ids, pool=None):
+    """
+    Строит миниатюры и WebP для фото. С pool работа Pillow идёт в дочерних
+    процессах, без него - в текущем.
+    """
+    images = list(ProductImage.objects.filter(pk__in=image_ids).exclude(image=""))
+    options = render_options()
+    if pool is not None:
+        futures = {
+            image.pk: pool.submit(render_derivatives, image.image.path, *options)
+            for image in images
+        }
+
+    done = 0
+    for image in images:
+        try:
+            if pool is None:
+                thumbnail, webp = render_derivatives(image.image.path, *options)
+            else:
+                thumbnail, webp = futures[image.pk].result()
+            save_derivatives(image, thumbnail, webp)
+            done += 1
+        except Exception:
+            logger.exception("Не удалось построить превью для фото %s", image.pk)
+    return done
+
+
+def save_derivatives(image, thumbnail, webp):
+    name = os.path.splitext(os.path.basename(image.image.name))[0]
+    image.thumbnail.save(f"{name}.jpg", ContentFile(thumbnail), save=False)
+    image.webp.save(f"{name}.webp", ContentFile(webp), save=False)
+    ProductImage.objects.filter(pk=image.pk).update(
+        thumbnail=image.thumbnail.name, webp=image.webp.name
+    )
+    # Производные входят в представление товара.
+    Product.objects.filter(pk=image.product_id).update(updated_at=timezone.now())
+
+
+def image_is_referenced(name):
+    """На файл ссылается фото товара или архивного товара."""
+    references = Q()
+    for field in IMAGE_FIELDS:
+        references |= Q(**{field: name})
+    return (
+        ProductImage.objects.filter(references).exists()
+        or ArchivedProductImage.objects.filter(references).exists()
+    )
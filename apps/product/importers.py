@@ -0,0 +1,179 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.fields import empty
+
+from apps.product.cache import defer_invalidation
+from apps.product.images import schedule_derivatives
+from apps.product.models import Category, Models, Product, ProductImage
+from apps.product.serializers import ProductCreateSerializer
+
+IMPORT_FORMATS = ("csv", "jsonl")
+FIELDS = ("title", "description", "price", "size")
+
+
+class InvalidRow:
+    """Строка, которую не удалось разобрать; попадает в ошибки как есть."""
+
+    def __init__(self, detail):
+        self.detail = detail
+
+
+def read_rows(stream, format):
+    """
+    Построчно читает бинарный поток CSV или JSONL в словари. Битая строка
+    JSONL не обрывает импорт - вместо неё отдаётся InvalidRow.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig")
+    if format == "csv":
+        yield from csv.DictReader(text)
+        return
+    for line in text:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            yield InvalidRow({"non_field_errors": [f"Некорректный JSON: {exc}"]})
+
+
+class ProductImporter:
+    """
+    Потоковый импорт товаров пачками.
+
+    Категории и модели ищутся по названию в словарях, собранных один раз,
+    правила проверки берутся из ProductCreateSerializer. Каждая пачка пишется
+    через bulk_create в своей транзакции и инвалидирует кеш один раз.
+    """
+    max_reported_errors = 1000
+
+    def __init__(self, batch_size=1000, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.serializer = ProductCreateSerializer()
+        self.categories = {c.title: c for c in Category.objects.all()}
+        self.models = defaultdict(list)
+        for model in Models.objects.select_related("category"):
+            self.models[model.title].append(model)
+        self.processed = 0
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def run(self, rows):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+            if self.progress:
+                self.progress(self)
+        return self.report()
+
+    def report(self):
+        return {
+            "processed": self.processed,
+            "created": self.created,
+            "failed": self.error_count,
+            "errors": self.errors,
+        }
+
+    def add_error(self, row_number, detail):
+        self.error_count += 1
+        if len(self.errors) < self.max_reported_errors:
+            self.errors.append({"row": row_number, "errors": detail})
+
+    def import_batch(self, batch):
+        products, images = [], []
+        for row in batch:
+            self.processed += 1
+            if isinstance(row, InvalidRow):
+                self.add_error(self.processed, row.detail)
+                continue
+            if not isinstance(row, dict):
+                self.add_error(self.processed, {"non_field_errors": ["Строка должна быть JSON-объектом."]})
+                continue
+            try:
+                names = self.image_names(row)
+                products.append(self.build_product(row))
+                images.append(names)
+            except serializers.ValidationError as exc:
+                self.add_error(self.processed, exc.detail)
+
+        if not products:
+            return
+        with transaction.atomic(), defer_invalidation():
+            Product.objects.bulk_create(products)
+            product_images = ProductImage.objects.bulk_create([
+                ProductImage(product=product, image=name)
+                for product, names in zip(products, images)
+                for name in names
+            ])
+            schedule_derivatives(image.pk for image in product_images)
+        self.created += len(products)
+
+    def build_product(self, row):
+        attrs, errors = {}, {}
+        for name in FIELDS:
+            try:
+                value = self.serializer.fields[name].run_validation(row.get(name, empty))
+                validate = getattr(self.serializer, f"validate_{name}", None)
+                attrs[name] = validate(value) if validate else value
+            except serializers.ValidationError as exc:
+                errors[name] = exc.detail
+
+        try:
+            attrs["category"] = self.resolve_category(row.get("category"))
+            attrs["model"] = self.resolve_model(row.get("model"), attrs["category"])
+        except serializers.ValidationError as exc:
+            errors.update(exc.detail)
+
+        if errors:
+            raise serializers.ValidationError(errors)
+        return Product(**self.serializer.validate(attrs))
+
+    def resolve_category(self, title):
+        if not title:
+            return None
+        if not isinstance(title, str):
+            raise serializers.ValidationError({"category": ["Ожидается название категории."]})
+        try:
+            return self.categories[title]
+        except KeyError:
+            raise serializers.ValidationError({"category": [f"Категория «{title}» не найдена."]})
+
+    def resolve_model(self, title, category):
+        if not title:
+            return None
+        if not isinstance(title, str):
+            raise serializers.ValidationError({"model": ["Ожидается название модели."]})
+        candidates = self.models.get(title, [])
+        if category and len(candidates) > 1:
+            candidates = [m for m in candidates if m.category_id == category.pk] or candidates
+        if not candidates:
+            raise serializers.ValidationError({"model": [f"Модель «{title}» не найдена."]})
+        if len(candidates) > 1:
+            raise serializers.ValidationError({"model": [f"Модель «{title}» неоднозначна, укажите категорию."]})
+        return candidates[0]
+
+    def image_names(self, row):
+        # Имена уже загруженных в хранилище файлов через «|».
+        value = row.get("images") or []
+        if isinstance(value, str):
+            value = value.split("|")
+        if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+            raise serializers.ValidationError({"images": ["Ожидается строка или список имён файлов."]})
+        names = value
+        names = [name.strip() for name in names if name.strip()]
+        storage = ProductImage._meta.get_field("image").storage
+        missing = [name for name in names if not storage.exists(name)]
+        if missing:
+            raise serializers.ValidationError({"images": [f"Файл {name} не найден." for name in missing]})
+        return names
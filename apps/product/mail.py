@@ -0,0 +1,110 @@
+"""
+Очередь исходящих писем.
+
+Представления только кладут письмо в EmailOutbox, отправляет команда
+send_outbox: забирает пачку писем, отправляет их через одно соединение
+get_connection() и при ошибке откладывает письмо с экспоненциальной
+задержкой. После EMAIL_OUTBOX_MAX_ATTEMPTS попыток письмо помечается
+как недоставленное (dead) и больше не отправляется.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from apps.product.models import EmailOutbox
+
+
+def enqueue_mail(subject, body, recipients, from_email=None):
+    return EmailOutbox.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+
+def retry_delay(attempts):
+    delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_DELAY))
+
+
+def claim_batch(batch_size):
+    """
+    Забирает до batch_size писем, которым пора уходить. Метка claim и
+    сдвиг next_attempt_at не дают другому воркеру взять те же письма, а
+    если воркер упадёт, письма вернутся в работу через EMAIL_OUTBOX_CLAIM_TTL.
+    """
+    now = timezone.now()
+    due = EmailOutbox.objects.filter(status=EmailOutbox.PENDING, next_attempt_at__lte=now)
+    pks = list(due.order_by("next_attempt_at", "pk").values_list("pk", flat=True)[:batch_size])
+    if not pks:
+        return []
+    claim = uuid.uuid4().hex
+    due.filter(pk__in=pks).update(
+        claim=claim,
+        next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TTL),
+    )
+    return list(EmailOutbox.objects.filter(claim=claim).order_by("pk"))
+
+
+def mark_failed(message, error):
+    message.attempts += 1
+    message.last_error = str(error)
+    message.claim = ""
+    if message.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        message.status = EmailOutbox.DEAD
+    else:
+        message.next_attempt_at = timezone.now() + retry_delay(message.attempts)
+    message.save(update_fields=["attempts", "last_error", "claim", "status", "next_attempt_at"])
+
+
+def deliver_batch(batch_size=None):
+    """Отправляет одну пачку. Возвращает (отправлено, с ошибкой)."""
+    messages = claim_batch(batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    if not messages:
+        return 0, 0
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        # Почтовый сервер недоступен - вся пачка уходит на повтор.
+        for message in messages:
+            mark_failed(message, exc)
+        return 0, len(messages)
+
+    sent, failed = [], 0
+    try:
+        for message in messages:
+            email = EmailMessage(
+                message.subject, message.body, message.from_email,
+                message.recipients, connection=connection,
+            )
+            try:
+                email.send()
+            except Exception as exc:
+                mark_failed(message, exc)
+                failed += 1
+            else:
+                sent.append(message.pk)
+    finally:
+        connection.close()
+
+    EmailOutbox.objects.filter(pk__in=sent).update(
+        status=EmailOutbox.SENT, sent_at=timezone.now(), claim="", last_error="",
+    )
+    return len(sent), failed
+
+
+def deliver_outbox(batch_size=None):
+    """Отправляет пачками всё, чему пора уходить. Возвращает (отправлено, с ошибкой)."""
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = deliver_batch(batch_size)
+        if not sent and not failed:
+            return total_sent, total_failed
+        total_sent += sent
+        total_failed += failed
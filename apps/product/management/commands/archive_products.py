@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.product.archive import archive_products, restore_products
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит долго неактивные товары в архив пачками "
+        "или возвращает их оттуда (--restore)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.PRODUCT_ARCHIVE_AFTER_DAYS)
+        parser.add_argument("--batch-size", type=int, default=settings.PRODUCT_ARCHIVE_BATCH_SIZE)
+        parser.add_argument("--max-batches", type=int, help="Остановиться после стольких пачек.")
+        parser.add_argument("--restore", nargs="+", metavar="UUID", help="Вернуть товары из архива.")
+
+    def handle(self, *args, **options):
+        if options["restore"]:
+            restored = restore_products(options["restore"])
+            self.stdout.write(self.style.SUCCESS(f"Восстановлено товаров: {restored}"))
+            return
+
+        total = archive_products(
+            cutoff=timezone.now() - timedelta(days=options["days"]),
+            batch_size=options["batch_size"],
+            max_batches=options["max_batches"],
+            progress=lambda total: self.stdout.write(f"Перенесено: {total}"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Перенесено в архив: {total}"))
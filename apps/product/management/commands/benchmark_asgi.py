@@ -0,0 +1,47 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand
+
+from apps.product.benchmark import run_asgi, run_wsgi
+
+PREFIX = "/api/v1/products/"
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает синхронные представления под WSGI с асинхронными под ASGI "
+        "при разном числе одновременных соединений."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="products/", help="Путь относительно /api/v1/products/.")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+        parser.add_argument("--json", action="store_true", help="Вывести результат в JSON.")
+
+    def handle(self, *args, **options):
+        from core.asgi import application as asgi_application
+        from core.wsgi import application as wsgi_application
+
+        sync_urls = [PREFIX + options["path"]] * options["requests"]
+        async_urls = [PREFIX + "async/" + options["path"]] * options["requests"]
+
+        results = []
+        for concurrency in options["concurrency"]:
+            results.append({
+                "concurrency": concurrency,
+                "wsgi": run_wsgi(wsgi_application, sync_urls, concurrency),
+                "asgi": asyncio.run(run_asgi(asgi_application, async_urls, concurrency)),
+            })
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            for name in ("wsgi", "asgi"):
+                row = result[name]
+                self.stdout.write(
+                    f"{name} c={result['concurrency']:<4} {row['throughput']:>9} req/s  "
+                    f"p50 {row['p50_ms']:>8} ms  p99 {row['p99_ms']:>8} ms  ошибок {row['errors']}"
+                )
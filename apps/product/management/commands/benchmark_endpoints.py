@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.product.benchmark import COMPARE_THRESHOLD, check_budgets, compare, run_suite
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет эндпоинты чтения с холодным и прогретым кешем: p50/p99, "
+        "пропускная способность, пик памяти, запросы к базе."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="Запросов на эндпоинт в каждом режиме.")
+        parser.add_argument("--only", nargs="+", help="Только эти эндпоинты.")
+        parser.add_argument("--output", help="Сохранить результат в JSON.")
+        parser.add_argument("--compare", help="JSON прошлого прогона для сравнения.")
+        parser.add_argument("--threshold", type=float, default=COMPARE_THRESHOLD)
+        parser.add_argument("--no-budgets", action="store_true", help="Не проверять бюджеты.")
+
+    def handle(self, *args, **options):
+        from core.wsgi import application
+
+        try:
+            report = run_suite(application, options["requests"], options["only"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        for name, modes in report["endpoints"].items():
+            for mode, row in modes.items():
+                self.stdout.write(
+                    f"{name:<22} {mode:<4} {row['throughput']:>9} req/s  p50 {row['p50_ms']:>8} ms  "
+                    f"p99 {row['p99_ms']:>8} ms  {row['peak_kb']:>9} KiB  SQL {row['queries']}"
+                )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+        failed = [] if options["no_budgets"] else check_budgets(report)
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+            for name, mode, metric, old, new in compare(baseline, report, options["threshold"]):
+                failed.append(f"{name} ({mode}): {metric} {old} -> {new}")
+
+        for problem in failed:
+            self.stderr.write(problem)
+        if failed:
+            raise CommandError(f"Превышены бюджеты или есть регрессии: {len(failed)}.")
+        self.stdout.write(self.style.SUCCESS("Бюджеты соблюдены."))
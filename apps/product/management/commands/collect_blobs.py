@@ -0,0 +1,21 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from apps.product.images import image_is_referenced
+from apps.product.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет файлы фото, на которые не ссылается ни одно фото товара, "
+        "и брошенные временные файлы загрузок."
+    )
+
+    def handle(self, *args, **options):
+        storage = ProductImage._meta.get_field("image").storage
+        removed = sum(storage.release(name, image_is_referenced) for name in storage.blob_names())
+        for path in storage.stale_tmp_files():
+            os.unlink(path)
+            removed += 1
+        self.stdout.write(self.style.SUCCESS(f"Удалено файлов: {removed}"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from apps.product.images import generate_derivatives, get_pool
+from apps.product.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = "Строит миниатюры и WebP для фото товаров, у которых их ещё нет."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Перестроить и уже готовые.")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=None, help="Размер пула процессов; 0 - строить в текущем процессе.")
+
+    def handle(self, *args, **options):
+        queryset = ProductImage.objects.order_by("pk")
+        if not options["all"]:
+            queryset = queryset.filter(thumbnail="")
+
+        pool = None if options["workers"] == 0 else get_pool(options["workers"])
+        last_pk, total = 0, 0
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk)
+                .values_list("pk", flat=True)[:options["batch_size"]]
+            )
+            if not batch:
+                break
+            total += generate_derivatives(batch, pool=pool)
+            last_pk = batch[-1]
+            self.stdout.write(f"Обработано фото: {total}")
+
+        self.stdout.write(self.style.SUCCESS(f"Готово, обработано фото: {total}"))
@@ -0,0 +1,39 @@
+import json
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.product.importers import IMPORT_FORMATS, ProductImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = "Потоковый импорт товаров из CSV или JSONL (- для stdin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=IMPORT_FORMATS)
+        parser.add_argument("--batch-size", type=int, default=settings.PRODUCT_IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"] or path.rsplit(".", 1)[-1].lower()
+        if format not in IMPORT_FORMATS:
+            raise CommandError(f"Укажите --format: {', '.join(IMPORT_FORMATS)}.")
+
+        importer = ProductImporter(
+            batch_size=options["batch_size"],
+            progress=lambda imp: self.stdout.write(
+                f"Обработано: {imp.processed}, создано: {imp.created}, ошибок: {imp.error_count}"
+            ),
+        )
+        stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+        with stream:
+            report = importer.run(read_rows(stream, format))
+
+        for error in report["errors"]:
+            detail = json.dumps(error["errors"], ensure_ascii=False)
+            self.stderr.write(f"Строка {error['row']}: {detail}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: создано {report['created']}, с ошибками {report['failed']}."
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.product.models import PasswordResetCode
+
+
+class Command(BaseCommand):
+    help = "Удаляет истёкшие коды сброса пароля пачками."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        expired = PasswordResetCode.objects.filter(created_at__lt=PasswordResetCode.expiry_cutoff())
+        total = 0
+        while True:
+            # Короткие транзакции не держат блокировку базы надолго.
+            pks = list(expired.values_list("pk", flat=True)[:options["batch_size"]])
+            if not pks:
+                break
+            total += PasswordResetCode.objects.filter(pk__in=pks).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f"Удалено кодов: {total}"))
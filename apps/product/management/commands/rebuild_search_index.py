@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.product.search import book_index, product_index
+
+
+class Command(BaseCommand):
+    help = "Полностью перестраивает FTS5-индексы товаров и книг."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        for name, index in (("товаров", product_index), ("книг", book_index)):
+            if not index.available():
+                raise CommandError("Полнотекстовый поиск доступен только на SQLite.")
+            total = index.rebuild(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Проиндексировано {name}: {total}"))
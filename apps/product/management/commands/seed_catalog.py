@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.product.models import Book, Category, Product
+from apps.product.seed import SIZES, CatalogSeeder, parse_size
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу детерминированным каталогом для бенчмарков: "
+        "категории, модели, товары с фото и книги."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", default="1k", help=f"Число товаров: {', '.join(SIZES)} или число.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--images", type=int, default=3, help="Фото на товар.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--flush", action="store_true", help="Удалить существующий каталог.")
+
+    def handle(self, *args, **options):
+        try:
+            products = parse_size(options["size"])
+        except ValueError:
+            raise CommandError(f"Неверный размер: {options['size']}.")
+
+        if options["flush"]:
+            Book.objects.all().delete()
+            Product.objects.all().delete()
+            Category.objects.all().delete()
+        elif Product.objects.exists():
+            raise CommandError("Каталог не пуст - добавьте --flush.")
+
+        seeder = CatalogSeeder(
+            products, seed=options["seed"],
+            images_per_product=options["images"], batch_size=options["batch_size"],
+        )
+        created = {}
+
+        def progress(name, count):
+            created[name] = created.get(name, 0) + count
+            self.stdout.write(f"{name}: {created[name]}")
+
+        seeder.run(progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: товаров {seeder.products}, книг {seeder.books}, категорий {seeder.categories}."
+        ))
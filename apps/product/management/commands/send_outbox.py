@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.product.mail import deliver_outbox
+
+
+class Command(BaseCommand):
+    help = "Отправляет письма из очереди EmailOutbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно, опрашивая очередь.")
+        parser.add_argument("--interval", type=float, default=5, help="Пауза между опросами, сек.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = deliver_outbox(options["batch_size"])
+            if sent or failed:
+                self.stdout.write(f"Отправлено: {sent}, с ошибкой: {failed}")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,276 @@
+"""
+Метрики запросов: число и время SQL, события кеша по пространствам имён,
+время сериализации, размер ответа.
+
+PerformanceMiddleware собирает их для каждого запроса, отдаёт в заголовке
+Server-Timing и складывает в гистограммы процесса, которые metrics_view
+отдаёт в текстовом формате Prometheus (каждый воркер - свои значения).
+У потоковых ответов тело читается после middleware: запросы, сделанные
+при его чтении, и размер учитываются, когда поток закрывается, а
+Server-Timing описывает только работу до отправки заголовков.
+/metrics доступен только с адресов METRICS_ALLOWED_IPS или с
+Authorization: Bearer <METRICS_TOKEN>.
+С PERF_DETECTOR = True в лог пишутся медленные запросы к базе и
+повторяющиеся запросы (N+1) вместе с представлением, которое их сделало.
+"""
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+logger = logging.getLogger("apps.product.performance")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.cache = Counter()
+        # Повторы одинаковых запросов и медленные запросы - для детектора.
+        self.statements = Counter()
+        self.slow = []
+
+
+def record_cache_event(namespace, event, count=1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache[(namespace, event)] += count
+
+
+@contextmanager
+def timed_serialization():
+    metrics = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.serialize_time += time.perf_counter() - started
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        metrics.queries += 1
+        metrics.sql_time += duration
+        if settings.PERF_DETECTOR:
+            metrics.statements[sql] += 1
+            if duration * 1000 >= settings.PERF_SLOW_QUERY_MS:
+                metrics.slow.append((duration, sql))
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    # Обёртка ставится на каждое новое соединение, в том числе в потоках
+    # sync_to_async; запрос к метрикам текущего запроса идёт через contextvar.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_wrapper, dispatch_uid="install_query_wrapper")
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = defaultdict(Histogram)
+        self.counters = Counter()
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            self.histograms[(name, labels)].observe(value)
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self.counters[(name, labels)] += value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, count in zip((*BUCKETS, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{{{labels}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name or match.route
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        response["Server-Timing"] = self.server_timing(metrics)
+        if not response.streaming:
+            self.record(request, response, metrics, len(response.content))
+        elif response.is_async:
+            response.streaming_content = self.ameasure_stream(
+                request, response, metrics, aiter(response.streaming_content)
+            )
+        else:
+            response.streaming_content = self.measure_stream(
+                request, response, metrics, iter(response.streaming_content)
+            )
+        return response
+
+    def measure_stream(self, request, response, metrics, iterator):
+        size = 0
+        try:
+            while True:
+                token = _current.set(metrics)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, response, metrics, size)
+
+    async def ameasure_stream(self, request, response, metrics, iterator):
+        size = 0
+        try:
+            while True:
+                token = _current.set(metrics)
+                try:
+                    chunk = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, response, metrics, size)
+
+    def server_timing(self, metrics):
+        total = time.perf_counter() - metrics.started
+        cache_desc = " ".join(
+            f"{namespace}:{event}={count}"
+            for (namespace, event), count in sorted(metrics.cache.items())
+        )
+        timings = [
+            f'db;dur={metrics.sql_time * 1000:.2f};desc="{metrics.queries} queries"',
+            f"serialize;dur={metrics.serialize_time * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ]
+        if cache_desc:
+            timings.insert(1, f'cache;desc="{cache_desc}"')
+        return ", ".join(timings)
+
+    def record(self, request, response, metrics, size):
+        total = time.perf_counter() - metrics.started
+        view = view_name(request)
+        labels = f'view="{view}",method="{request.method}"'
+        registry.observe("http_request_duration_seconds", labels, total)
+        registry.observe("http_request_db_seconds", labels, metrics.sql_time)
+        registry.observe("http_request_serialize_seconds", labels, metrics.serialize_time)
+        registry.inc("http_requests_total", f'{labels},status="{response.status_code}"')
+        registry.inc("http_request_db_queries_total", labels, metrics.queries)
+        registry.inc("http_response_bytes_total", labels, size)
+        for (namespace, event), count in metrics.cache.items():
+            registry.inc("cache_events_total", f'namespace="{namespace}",event="{event}"', count)
+
+        if settings.PERF_DETECTOR:
+            self.report_problems(view, metrics)
+
+    def report_problems(self, view, metrics):
+        for duration, sql in metrics.slow:
+            logger.warning("Медленный запрос в %s (%.1f мс): %s", view, duration * 1000, sql)
+        for sql, count in metrics.statements.items():
+            if count >= settings.PERF_N_PLUS_ONE_THRESHOLD:
+                logger.warning("Возможный N+1 в %s: %d одинаковых запросов: %s", view, count, sql)
+
+
+def metrics_allowed(request):
+    if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    header = request.headers.get("Authorization", "")
+    return bool(token) and hmac.compare_digest(header, f"Bearer {token}")
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponse("Доступ запрещён.", status=403, content_type="text/plain; charset=utf-8")
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
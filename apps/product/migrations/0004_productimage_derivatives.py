@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0003_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='products/thumbnails/', verbose_name='Миниатюра'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='webp',
+            field=models.ImageField(blank=True, upload_to='products/webp/', verbose_name='Фото в WebP'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 17:05
+
+import apps.product.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0004_productimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(db_index=True, storage=apps.product.storage.product_image_storage, upload_to='products/', verbose_name='Фото продукта'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, storage=apps.product.storage.product_image_storage, upload_to='products/thumbnails/', verbose_name='Миниатюра'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='webp',
+            field=models.ImageField(blank=True, storage=apps.product.storage.product_image_storage, upload_to='products/webp/', verbose_name='Фото в WebP'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0005_productimage_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['created_at', 'id'], name='book_created_at_id_idx'),
+        ),
+    ]
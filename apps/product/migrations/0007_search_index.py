@@ -0,0 +1,48 @@
+# Generated by Django 6.0 on 2026-10-18 19:00
+
+from django.db import migrations
+
+TOKENIZE = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+
+CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+    f"title, description, category_id UNINDEXED, is_active UNINDEXED, {TOKENIZE})",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_search USING fts5("
+    f"title, author, description, category_id UNINDEXED, {TOKENIZE})",
+]
+POPULATE = [
+    "INSERT INTO product_search (rowid, title, description, category_id, is_active) "
+    "SELECT id, title, description, category_id, is_active FROM product_product",
+    "INSERT INTO book_search (rowid, title, author, description, category_id) "
+    "SELECT id, title, author, COALESCE(description, ''), category_id FROM product_book",
+]
+DROP = [
+    "DROP TABLE IF EXISTS product_search",
+    "DROP TABLE IF EXISTS book_search",
+]
+
+
+def create_search_tables(apps, schema_editor):
+    # FTS5 есть только в SQLite, на других базах поиск недоступен.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE + POPULATE:
+        schema_editor.execute(sql)
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0006_book_created_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 20:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0009_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='passwordresetcode',
+            index=models.Index(fields=['email', 'code'], name='reset_code_email_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='passwordresetcode',
+            index=models.Index(fields=['created_at'], name='reset_code_created_at_idx'),
+        ),
+    ]
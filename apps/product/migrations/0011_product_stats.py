@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-18 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0010_password_reset_code_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='product.product', verbose_name='Продукт')),
+                ('views', models.PositiveBigIntegerField(default=0, verbose_name='Просмотры')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Статистика продукта',
+                'verbose_name_plural': 'Статистика продуктов',
+                'indexes': [models.Index(fields=['-views', 'product'], name='product_stats_views_idx')],
+            },
+        ),
+    ]
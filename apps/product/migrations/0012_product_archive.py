@@ -0,0 +1,78 @@
+# Generated by Django 6.0 on 2026-10-18 15:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0011_product_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedProduct',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('uuid', models.UUIDField(unique=True, verbose_name='UUID')),
+                ('title', models.CharField(max_length=155, verbose_name='Название')),
+                ('description', models.TextField(verbose_name='Описание товара')),
+                ('price', models.IntegerField(verbose_name='Цена Товара')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создание')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата изменения')),
+                ('size', models.CharField(max_length=55, verbose_name='Размер')),
+                ('is_active', models.BooleanField(default=False, verbose_name='Активен')),
+                ('views', models.PositiveBigIntegerField(default=0, verbose_name='Просмотры')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+            ],
+            options={
+                'verbose_name': 'Архивный продукт',
+                'verbose_name_plural': 'Архивные продукты',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedProductImage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('image', models.CharField(db_index=True, max_length=100)),
+                ('thumbnail', models.CharField(blank=True, max_length=100)),
+                ('webp', models.CharField(blank=True, max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Фото архивного продукта',
+                'verbose_name_plural': 'Фото архивных продуктов',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_active_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='product_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', '-created_at', '-id'], name='product_live_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['updated_at'], name='product_inactive_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedproduct',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_products', to='product.category'),
+        ),
+        migrations.AddField(
+            model_name='archivedproduct',
+            name='model',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_products', to='product.models'),
+        ),
+        migrations.AddField(
+            model_name='archivedproductimage',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='product.archivedproduct', verbose_name='Продукт'),
+        ),
+    ]
@@ -1,12 +1,75 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.dispatch import Signal
+from django.utils import timezone
 import uuid
 
+from apps.product.cache import defer_invalidation, invalidate
+from apps.product.storage import product_image_storage
+
+
+# Шлётся после массовых операций, которые не вызывают post_save:
+# update(), bulk_create(), bulk_update(). Аргумент pks - затронутые строки.
+bulk_changed = Signal()
+
+
+class CacheInvalidatingQuerySet(models.QuerySet):
+    """
+    Массовые операции не шлют post_save/post_delete, поэтому кеш
+    инвалидируется здесь - один раз на вызов, а подписчики bulk_changed
+    получают список затронутых pk.
+    """
+
+    def _has_updated_at(self):
+        return any(f.name == 'updated_at' for f in self.model._meta.concrete_fields)
+
+    def update(self, **kwargs):
+        if self._has_updated_at():
+            kwargs.setdefault('updated_at', timezone.now())
+        pks = None
+        if bulk_changed.has_listeners(self.model):
+            pks = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        invalidate(self.model)
+        if pks:
+            bulk_changed.send(sender=self.model, pks=pks)
+        return rows
+
+    def delete(self):
+        with defer_invalidation():
+            result = super().delete()
+            invalidate(self.model)
+        return result
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        invalidate(self.model)
+        bulk_changed.send(sender=self.model, pks=[obj.pk for obj in objs if obj.pk])
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if self._has_updated_at() and 'updated_at' not in fields:
+            now = timezone.now()
+            for obj in objs:
+                obj.updated_at = now
+            fields = [*fields, 'updated_at']
+        # bulk_update сам вызывает update() по пачкам, bulk_changed шлётся там.
+        with defer_invalidation():
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            invalidate(self.model)
+        return rows
+
+
 class Category(models.Model):
     title = models.CharField(
         max_length=155,
         verbose_name='Название'
     )
 
+    objects = CacheInvalidatingQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
@@ -27,6 +90,8 @@ class Models(models.Model):
         blank=True, null=True
     )
 
+    objects = CacheInvalidatingQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
@@ -45,7 +110,7 @@ class Product(models.Model):
         Category,
         on_delete=models.CASCADE,
         verbose_name='Category',
-        related_name='category', 
+        related_name='products', 
         blank=True, null=True
     )
     model = models.ForeignKey(
@@ -69,6 +134,10 @@ class Product(models.Model):
         auto_now_add=True,
         verbose_name='Дата создание'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
     size = models.CharField(
         max_length=55,
         verbose_name='Размер'
@@ -78,12 +147,77 @@ class Product(models.Model):
         verbose_name='Активен'
     )
 
+    objects = CacheInvalidatingQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='product_created_at_id_idx'
+            ),
+            # Фильтры каталога вместе с порядком пагинации.
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                name='product_category_created_idx'
+            ),
+            models.Index(
+                fields=['model', '-created_at', '-id'],
+                name='product_model_created_idx'
+            ),
+            models.Index(
+                fields=['size', '-created_at', '-id'],
+                name='product_size_created_idx'
+            ),
+            # Лента показывает только активные товары: частичные индексы
+            # не растут вместе с неактивными.
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='product_live_created_idx'
+            ),
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='product_live_category_idx'
+            ),
+            # Кандидаты в архив (apps.product.archive).
+            models.Index(
+                fields=['updated_at'],
+                condition=models.Q(is_active=False),
+                name='product_inactive_updated_idx'
+            ),
+            models.Index(fields=['price'], name='product_price_idx'),
+        ]
+
+class ProductStats(models.Model):
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Продукт'
+    )
+    # Пишется пачками из apps.product.popularity, не на каждый просмотр.
+    views = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Просмотры'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+
+    class Meta:
+        verbose_name = 'Статистика продукта'
+        verbose_name_plural = 'Статистика продуктов'
+        indexes = [
+            models.Index(fields=['-views', 'product'], name='product_stats_views_idx'),
+        ]
 
 class ProductImage(models.Model):
     product = models.ForeignKey(
@@ -94,13 +228,84 @@ class ProductImage(models.Model):
     )
     image = models.ImageField(
         upload_to='products/',
+        storage=product_image_storage,
+        db_index=True,
         verbose_name='Фото продукта'
     )
+    thumbnail = models.ImageField(
+        upload_to='products/thumbnails/',
+        storage=product_image_storage,
+        blank=True,
+        verbose_name='Миниатюра'
+    )
+    webp = models.ImageField(
+        upload_to='products/webp/',
+        storage=product_image_storage,
+        blank=True,
+        verbose_name='Фото в WebP'
+    )
+
+    objects = CacheInvalidatingQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Фото продукта'
         verbose_name_plural = 'Фото продуктов'
 
+class ArchivedProduct(models.Model):
+    """
+    Долго неактивный товар, вынесенный из горячей таблицы
+    (apps.product.archive). id и uuid те же, что были у товара.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    uuid = models.UUIDField(unique=True, verbose_name='UUID')
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name='archived_products',
+        blank=True, null=True
+    )
+    model = models.ForeignKey(
+        Models,
+        on_delete=models.CASCADE,
+        related_name='archived_products',
+        blank=True, null=True
+    )
+    title = models.CharField(max_length=155, verbose_name='Название')
+    description = models.TextField(verbose_name='Описание товара')
+    price = models.IntegerField(verbose_name='Цена Товара')
+    created_at = models.DateTimeField(verbose_name='Дата создание')
+    updated_at = models.DateTimeField(verbose_name='Дата изменения')
+    size = models.CharField(max_length=55, verbose_name='Размер')
+    is_active = models.BooleanField(default=False, verbose_name='Активен')
+    views = models.PositiveBigIntegerField(default=0, verbose_name='Просмотры')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        verbose_name = 'Архивный продукт'
+        verbose_name_plural = 'Архивные продукты'
+
+
+class ArchivedProductImage(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(
+        ArchivedProduct,
+        on_delete=models.CASCADE,
+        related_name='images',
+        verbose_name='Продукт'
+    )
+    # Имена файлов в product_image_storage: сами файлы остаются на месте.
+    image = models.CharField(max_length=100, db_index=True)
+    thumbnail = models.CharField(max_length=100, blank=True)
+    webp = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        verbose_name = 'Фото архивного продукта'
+        verbose_name_plural = 'Фото архивных продуктов'
+
+
 from django.core.validators import MinValueValidator
 
 class Book(models.Model):
@@ -116,9 +321,16 @@ class Book(models.Model):
     published_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CacheInvalidatingQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='book_created_at_id_idx'),
+        ]
+
 import random
 class PasswordResetCode(models.Model):
     email = models.EmailField()
@@ -130,5 +342,56 @@ class PasswordResetCode(models.Model):
             self.code = str(random.randint(100000, 999999))
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def expiry_cutoff():
+        """Коды, созданные раньше этого момента, недействительны."""
+        return timezone.now() - timedelta(seconds=settings.PASSWORD_RESET_CODE_TTL)
+
+    def __str__(self):
+        return f"{self.email} - {self.code}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['email', 'code'], name='reset_code_email_code_idx'),
+            models.Index(fields=['created_at'], name='reset_code_created_at_idx'),
+        ]
+
+class EmailOutbox(models.Model):
+    """Письмо в очереди на отправку; отправляет команда send_outbox."""
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (SENT, 'Отправлено'),
+        (DEAD, 'Не доставлено'),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    from_email = models.CharField(max_length=254, verbose_name='Отправитель')
+    recipients = models.JSONField(verbose_name='Получатели')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попытки')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    # Метка воркера, который забрал письмо в работу.
+    claim = models.CharField(max_length=32, blank=True, verbose_name='Метка воркера')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата отправки')
+
     def __str__(self):
-        return f"{self.email} - {self.code}"
\ No newline at end of file
+        return f"{', '.join(self.recipients)} - {self.subject}"
+
+    class Meta:
+        verbose_name = 'Письмо'
+        verbose_name_plural = 'Исходящие письма'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+            models.Index(fields=['claim'], name='outbox_claim_idx'),
+        ]
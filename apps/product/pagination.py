@@ -0,0 +1,130 @@
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def query_params(request):
+    # Пагинация работает и с запросами DRF, и с обычными HttpRequest.
+    return getattr(request, "query_params", request.GET)
+
+
+def encode_cursor(created_at, pk):
+    raw = json.dumps([created_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, pk = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError):
+        raise NotFound("Неверный курсор.")
+
+
+def encode_position(position):
+    """Курсор страницы готового рейтинга - позиция в нём."""
+    return base64.urlsafe_b64encode(json.dumps(["rank", position]).encode()).decode().rstrip("=")
+
+
+def decode_position(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        kind, position = json.loads(raw)
+        if kind != "rank":
+            raise ValueError
+        return max(0, int(position))
+    except (ValueError, TypeError):
+        raise NotFound("Неверный курсор.")
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по (created_at, id) от новых к старым.
+
+    Страница выбирается через WHERE по последней позиции, а не через OFFSET,
+    поэтому стоимость любой страницы одинакова и опирается на индекс
+    product_created_at_id_idx.
+    """
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def get_page_size(self, request):
+        page_size = settings.PRODUCT_LIST_PAGE_SIZE
+        try:
+            page_size = int(query_params(request)[self.page_size_query_param])
+        except (KeyError, ValueError):
+            pass
+        return max(1, min(page_size, settings.PRODUCT_LIST_MAX_PAGE_SIZE))
+
+    def get_position(self, request):
+        cursor = query_params(request).get(self.cursor_query_param)
+        return decode_cursor(cursor) if cursor else None
+
+    def page_queryset(self, queryset, request):
+        """Срез на страницу плюс одну строку - по ней видно, есть ли следующая."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.get_position(request)
+
+        queryset = queryset.order_by("-created_at", "-id")
+        if position:
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__lte=created_at),
+                Q(created_at__lt=created_at) | Q(id__lt=pk),
+            )
+        return queryset[:self.page_size + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        return self.finish_page([row async for row in self.page_queryset(queryset, request)])
+
+    def finish_page(self, rows):
+        self.next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_cursor = encode_cursor(*self.get_row_position(rows[-1]))
+        return rows
+
+    def get_row_position(self, row):
+        if isinstance(row, dict):
+            return row["created_at"], row["id"]
+        return row.created_at, row.pk
+
+    def get_paginated_response(self, data):
+        return self.build_response(self.request, data, self.next_cursor)
+
+    def get_next_link(self, request, next_cursor):
+        if not next_cursor:
+            return None
+        url = request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, next_cursor)
+
+    def build_response(self, request, data, next_cursor):
+        return Response({
+            "next": self.get_next_link(request, next_cursor),
+            "results": data,
+        })
+
+    def build_raw_response(self, request, results, next_cursor, extra=None):
+        """
+        Ответ из уже отрендеренного JSON-массива results (байты).
+        extra - дополнительные ключи верхнего уровня (например, facets).
+        """
+        next_link = json.dumps(self.get_next_link(request, next_cursor), ensure_ascii=False)
+        content = b'{"next":' + next_link.encode() + b',"results":' + results
+        for key, value in (extra or {}).items():
+            content += b',' + json.dumps(key).encode() + b':' + JSONRenderer().render(value)
+        return HttpResponse(content + b'}', content_type="application/json")
@@ -0,0 +1,182 @@
+"""
+Счётчики просмотров товаров с отложенной записью.
+
+Просмотр только увеличивает счётчик в памяти процесса. Раз в
+POPULARITY_FLUSH_INTERVAL секунд (после ответа на очередной запрос) и при
+завершении процесса накопленное пишется в ProductStats одним
+INSERT ... ON CONFLICT DO UPDATE на пачку, и сразу же пересчитывается
+рейтинг top-N для ?ordering=popular. Чтение товара никогда не ждёт
+блокировку записи SQLite.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import connections, transaction
+from django.utils import timezone
+
+from rest_framework.renderers import JSONRenderer
+
+from apps.product.cache import invalidate
+from apps.product.filters import filter_products, filters_key
+from apps.product.fragments import join_fragments, list_fragments
+from apps.product.metrics import timed_serialization
+from apps.product.models import Product, ProductImage, ProductStats
+from apps.product.pagination import decode_position, encode_position
+from apps.product.serializers import ProductSerializer
+from apps.product.sparse import sparse_key
+from core.db_router import PRIMARY
+
+logger = logging.getLogger(__name__)
+
+RANKING_KEY = "product_popular_ranking"
+POPULAR_DEPENDS_ON = (Product, ProductImage, ProductStats)
+# Не больше 999 параметров на запрос в старых сборках SQLite: по 3 на строку.
+UPSERT_BATCH_SIZE = 300
+
+_lock = threading.Lock()
+_buffer = Counter()
+_last_flush = time.monotonic()
+
+
+def record_view(uuid):
+    with _lock:
+        _buffer[str(uuid)] += 1
+
+
+def take_buffer():
+    global _buffer
+    with _lock:
+        buffer, _buffer = _buffer, Counter()
+    return buffer
+
+
+def upsert_views(counts):
+    """counts - {product_id: просмотров}; прибавляет к уже записанным."""
+    table = ProductStats._meta.db_table
+    now = timezone.now()
+    rows = list(counts.items())
+    with connections[PRIMARY].cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO "{table}" ("product_id", "views", "updated_at") '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT ("product_id") DO UPDATE SET '
+                f'"views" = "{table}"."views" + excluded."views", '
+                f'"updated_at" = excluded."updated_at"',
+                [value for pk, views in batch for value in (pk, views, now)],
+            )
+
+
+def flush_views():
+    """Пишет накопленные просмотры и обновляет рейтинг. Возвращает число товаров."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    buffer = take_buffer()
+    if not buffer:
+        return 0
+
+    # Удалённые за это время товары просто отбрасываются.
+    ids = {
+        str(uuid): pk
+        for uuid, pk in Product.objects.using(PRIMARY).filter(uuid__in=list(buffer))
+        .values_list("uuid", "id")
+    }
+    counts = {ids[uuid]: views for uuid, views in buffer.items() if uuid in ids}
+    if counts:
+        with transaction.atomic(using=PRIMARY):
+            upsert_views(counts)
+            invalidate(ProductStats)
+        refresh_ranking()
+    return len(counts)
+
+
+def refresh_ranking():
+    # Сразу после записи просмотров реплика может ещё отставать.
+    ranking = list(
+        ProductStats.objects.using(PRIMARY).order_by("-views", "product_id")
+        .values_list("product_id", flat=True)[:settings.POPULAR_TOP_N]
+    )
+    cache.set(RANKING_KEY, ranking, timeout=None)
+    return ranking
+
+
+def get_ranking():
+    ranking = cache.get(RANKING_KEY)
+    if ranking is None:
+        ranking = refresh_ranking()
+    return ranking
+
+
+def maybe_flush(**kwargs):
+    if time.monotonic() - _last_flush >= settings.POPULARITY_FLUSH_INTERVAL:
+        flush_views()
+
+
+def flush_on_exit():
+    try:
+        flush_views()
+    except Exception:
+        # При остановке процесса база уже может быть недоступна.
+        logger.exception("Не удалось записать просмотры при завершении процесса")
+
+
+request_finished.connect(maybe_flush, dispatch_uid="flush_product_views")
+atexit.register(flush_on_exit)
+
+
+def popular_page(filters, position, page_size):
+    """
+    Строки (id, created_at, updated_at) страницы рейтинга с позиции position
+    и позиция следующей страницы. С фильтрами рейтинг просматривается
+    кусками, пока не наберётся страница.
+    """
+    ranking = get_ranking()
+    rows = []
+    while position < len(ranking) and len(rows) <= page_size:
+        chunk = ranking[position:position + page_size * 2]
+        found = {
+            row["id"]: row
+            for row in filter_products(Product.objects.filter(pk__in=chunk), filters)
+            .values("id", "created_at", "updated_at")
+        }
+        for pk in chunk:
+            position += 1
+            if pk in found:
+                rows.append(found[pk])
+                if len(rows) > page_size:
+                    # Лишняя строка - признак следующей страницы, с неё и продолжим.
+                    position -= 1
+                    break
+    if len(rows) > page_size:
+        return rows[:page_size], position
+    return rows, None
+
+
+def popular_list_key(page_size, cursor, filters, fields):
+    return f"product_popular:{page_size}:{cursor}:{filters_key(filters)}:{fields}"
+
+
+def build_popular_list(request, filters, cursor, page_size):
+    """Данные страницы ?ordering=popular для кеша: общие для sync и async лент."""
+    rows, position = popular_page(filters, decode_position(cursor) if cursor else 0, page_size)
+    if sparse_key(request):
+        products = ProductSerializer.optimize_queryset(
+            Product.objects.prefetch_related("images"), request
+        ).in_bulk([row["id"] for row in rows])
+        serializer = ProductSerializer(
+            [products[row["id"]] for row in rows if row["id"] in products],
+            many=True, context={"sparse_request": request},
+        )
+        with timed_serialization():
+            results = JSONRenderer().render(serializer.data)
+    else:
+        results = join_fragments(list_fragments(rows))
+    next_cursor = encode_position(position) if position is not None else None
+    return {"results": results, "next_cursor": next_cursor}
@@ -0,0 +1,128 @@
+import re
+from itertools import islice
+
+from django.db import connection, transaction
+
+from apps.product.models import Book, Product
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(text):
+    """Каждое слово запроса - префиксный поиск, все слова обязательны."""
+    tokens = TOKEN_RE.findall(text.lower())
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+class SearchIndex:
+    """
+    Полнотекстовый индекс модели во FTS5-таблице той же базы SQLite.
+
+    rowid строки индекса равен pk объекта. columns - индексируемые поля с
+    весами BM25, filters - неиндексируемые поля для фильтрации.
+    """
+    table = None
+    model = None
+    columns = {}
+    filters = ()
+    # Не больше 999 параметров на запрос в старых сборках SQLite.
+    chunk_size = 500
+
+    def available(self):
+        return connection.vendor == "sqlite"
+
+    def _row(self, values):
+        return [values["pk"], *(values[c] or "" for c in self.columns), *(values[f] for f in self.filters)]
+
+    def _values(self, queryset):
+        return queryset.values("pk", *self.columns, *self.filters)
+
+    def _insert(self, cursor, rows):
+        fields = ", ".join(["rowid", *self.columns, *self.filters])
+        placeholders = ", ".join(["%s"] * (1 + len(self.columns) + len(self.filters)))
+        cursor.executemany(
+            f"INSERT INTO {self.table} ({fields}) VALUES ({placeholders})", rows
+        )
+
+    def _chunks(self, pks):
+        pks = list(pks)
+        for start in range(0, len(pks), self.chunk_size):
+            yield pks[start:start + self.chunk_size]
+
+    def remove(self, pks):
+        if not self.available():
+            return
+        with connection.cursor() as cursor:
+            for chunk in self._chunks(pks):
+                cursor.execute(
+                    f"DELETE FROM {self.table} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})",
+                    chunk,
+                )
+
+    def update(self, pks):
+        """Переиндексирует объекты по pk; удалённые просто пропадают из индекса."""
+        if not self.available():
+            return
+        for chunk in self._chunks(pks):
+            self.remove(chunk)
+            rows = [self._row(values) for values in self._values(self.model.objects.filter(pk__in=chunk))]
+            if rows:
+                with connection.cursor() as cursor:
+                    self._insert(cursor, rows)
+
+    def rebuild(self, batch_size=2000):
+        if not self.available():
+            return 0
+        total = 0
+        # Читатели видят старый индекс до коммита, а при ошибке он остаётся целым.
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            rows = self._values(self.model.objects.order_by("pk")).iterator(chunk_size=batch_size)
+            while True:
+                batch = [self._row(values) for values in islice(rows, batch_size)]
+                if not batch:
+                    break
+                self._insert(cursor, batch)
+                total += len(batch)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+        return total
+
+    def search(self, text, limit=20, offset=0, **filters):
+        """pk найденных объектов по убыванию релевантности (BM25)."""
+        match = build_match_query(text)
+        if not match or not self.available():
+            return []
+        weights = ", ".join(str(weight) for weight in self.columns.values())
+        where = [f"{self.table} MATCH %s"]
+        params = [match]
+        for name, value in filters.items():
+            if name in self.filters and value is not None:
+                where.append(f"{name} = %s")
+                params.append(value)
+        sql = (
+            f"SELECT rowid FROM {self.table} WHERE {' AND '.join(where)} "
+            f"ORDER BY bm25({self.table}, {weights}) LIMIT %s OFFSET %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*params, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class ProductSearchIndex(SearchIndex):
+    table = "product_search"
+    model = Product
+    columns = {"title": 10.0, "description": 1.0}
+    filters = ("category_id", "is_active")
+
+
+class BookSearchIndex(SearchIndex):
+    table = "book_search"
+    model = Book
+    columns = {"title": 10.0, "author": 5.0, "description": 1.0}
+    filters = ("category_id",)
+
+
+product_index = ProductSearchIndex()
+book_index = BookSearchIndex()
+SEARCH_INDEXES = {Product: product_index, Book: book_index}
@@ -0,0 +1,109 @@
+"""
+Детерминированный генератор каталога для бенчмарков и тестов:
+категории -> модели -> товары с несколькими фото, плюс книги.
+
+При одном и том же seed получается один и тот же каталог (кроме дат
+создания), поэтому результаты бенчмарков сравнимы между коммитами.
+"""
+import random
+import uuid
+from datetime import date, timedelta
+from itertools import islice
+
+from django.db import transaction
+
+from apps.product.cache import defer_invalidation
+from apps.product.models import Book, Category, Models, Product, ProductImage
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+WORDS = (
+    "кроссовки", "ботинки", "куртка", "рубашка", "свитер", "кеды", "пальто",
+    "джинсы", "футболка", "шапка", "классический", "спортивный", "зимний",
+    "летний", "кожаный", "хлопковый", "чёрный", "белый", "синий", "красный",
+)
+SHOE_SIZES = [str(size) for size in range(36, 47)]
+
+
+def parse_size(value):
+    return SIZES.get(value) or int(value)
+
+
+class CatalogSeeder:
+    """
+    products - число товаров; книг вдвое меньше, категорий - по одной на
+    тысячу товаров (не меньше 5), по 5 моделей на категорию.
+    """
+
+    def __init__(self, products, seed=0, images_per_product=3, batch_size=5000):
+        self.products = products
+        self.books = max(1, products // 2)
+        self.categories = max(5, products // 1000)
+        self.models_per_category = 5
+        self.images_per_product = images_per_product
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def text(self, words):
+        return " ".join(self.rng.choice(WORDS) for _ in range(words))
+
+    def run(self, progress=None):
+        with defer_invalidation():
+            with transaction.atomic():
+                categories = Category.objects.bulk_create(
+                    Category(title=f"Категория {i}") for i in range(self.categories)
+                )
+                models = Models.objects.bulk_create(
+                    Models(title=f"Модель {category.pk}-{i}", category=category)
+                    for category in categories
+                    for i in range(self.models_per_category)
+                )
+            self.create_in_batches(self.product_rows(models), self.save_products, progress)
+            self.create_in_batches(self.book_rows(categories), Book.objects.bulk_create, progress)
+
+    def create_in_batches(self, rows, save, progress):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return
+            with transaction.atomic():
+                save(batch)
+            if progress:
+                progress(batch[0]._meta.model_name, len(batch))
+
+    def save_products(self, batch):
+        Product.objects.bulk_create(batch)
+        ProductImage.objects.bulk_create(
+            ProductImage(product=product, image=f"seed/{product.uuid.hex}_{n}.jpg")
+            for product in batch
+            for n in range(self.images_per_product)
+        )
+
+    def product_rows(self, models):
+        for i in range(self.products):
+            model = self.rng.choice(models)
+            yield Product(
+                uuid=self.uuid(),
+                category_id=model.category_id,
+                model=model,
+                title=f"{self.text(3).capitalize()} {i}",
+                description=self.text(30),
+                price=self.rng.randint(500, 50_000),
+                size=self.rng.choice(SHOE_SIZES),
+                is_active=self.rng.random() > 0.1,
+            )
+
+    def book_rows(self, categories):
+        start = date(1950, 1, 1)
+        for i in range(self.books):
+            yield Book(
+                title=f"{self.text(2).capitalize()} {i}",
+                author=f"Автор {self.rng.randint(1, 5000)}",
+                description=self.text(40),
+                price=self.rng.randint(100, 5000),
+                published_date=start + timedelta(days=self.rng.randint(0, 27_000)),
+                category=self.rng.choice(categories),
+            )
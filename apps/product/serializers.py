@@ -1,15 +1,36 @@
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
 from rest_framework import serializers
 
+from apps.product.images import schedule_derivatives
 from apps.product.models import Category, Models, Product, ProductImage
-from lesson_1.apps import product
+from apps.product.sparse import SparseFieldsMixin
+
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = '__all__'
+
+class ModelsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    category_name = serializers.ReadOnlyField(source='category.title')
+    expandable_fields = {"category": CategorySerializer}
+
+    class Meta:
+        model = Models
+        fields = '__all__'
 
 class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductImage
-        fields = ['image']
+        fields = ['image', 'thumbnail', 'webp']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     first_image = serializers.SerializerMethodField()
+    first_image_thumbnail = serializers.SerializerMethodField()
+    method_field_sources = {
+        "first_image": ("images",),
+        "first_image_thumbnail": ("images",),
+    }
 
     class Meta:
         model = Product
@@ -19,19 +40,74 @@ class ProductSerializer(serializers.ModelSerializer):
             "title",
             "description",
             "price",
-            "first_image"
+            "first_image",
+            "first_image_thumbnail",
         ]
 
+    def _first_image(self, obj):
+        # images.all() берёт данные из prefetch_related, а first() делал бы
+        # отдельный запрос на каждый товар.
+        return min(obj.images.all(), key=lambda img: img.pk, default=None)
+
     def get_first_image(self, obj):
-        first_img = obj.images.first()
+        first_img = self._first_image(obj)
         if first_img:
             return first_img.image.url
         return None
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+    def get_first_image_thumbnail(self, obj):
+        first_img = self._first_image(obj)
+        if first_img and first_img.thumbnail:
+            return first_img.thumbnail.url
+        return None
+
+
+PRODUCT_LIST_FIELDS = ("id", "uuid", "title", "description", "price")
+
+
+def product_list_values(queryset):
+    """
+    Быстрый путь для списков: строки как словари, первое фото - подзапросом
+    в том же SELECT. created_at нужен только для курсора пагинации.
+    """
+    first_image = (
+        ProductImage.objects
+        .filter(product=OuterRef("pk"))
+        .order_by("pk")
+    )
+    return queryset.annotate(
+        first_image_name=Subquery(first_image.values("image")[:1]),
+        first_image_thumbnail_name=Subquery(first_image.values("thumbnail")[:1]),
+    ).values(
+        *PRODUCT_LIST_FIELDS, "first_image_name", "first_image_thumbnail_name", "created_at"
+    )
+
+
+def product_list_rows(rows):
+    """Строки product_list_values в том же виде, что и ProductSerializer."""
+    image_url = ProductImage._meta.get_field("image").storage.url
+
+    def url(name):
+        return image_url(name) if name else None
+
+    return [
+        {
+            "id": row["id"],
+            "uuid": str(row["uuid"]),
+            "title": row["title"],
+            "description": row["description"],
+            "price": row["price"],
+            "first_image": url(row["first_image_name"]),
+            "first_image_thumbnail": url(row["first_image_thumbnail_name"]),
+        }
+        for row in rows
+    ]
+
+class ProductDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     category_title = serializers.CharField(source='category.title', read_only=True)
     model_title = serializers.CharField(source='model.title', read_only=True)
+    expandable_fields = {"category": CategorySerializer, "model": ModelsSerializer}
 
     class Meta:
         model = Product
@@ -39,7 +115,7 @@ class ProductDetailSerializer(serializers.ModelSerializer):
             "id", "uuid", "title", 
             "description", "price", 
             "created_at", "size", 
-            "is_active", "is_favorite", 
+            "is_active", 
             "images", "model_title", "category_title"
         ]
 
@@ -87,14 +163,19 @@ class ProductCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         uploaded_images = validated_data.pop('uploaded_images', [])
         product = Product.objects.create(**validated_data)
-        for image in uploaded_images:
-            ProductImage.objects.create(product=product, image=image)
+        image_ids = [
+            ProductImage.objects.create(product=product, image=image).pk
+            for image in uploaded_images
+        ]
+        schedule_derivatives(image_ids)
 
         return product
 
 from .models import Book
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {"category": CategorySerializer}
+
     class Meta:
         model = Book
         fields = '__all__'
@@ -104,17 +185,52 @@ class BookSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Цена должна быть больше нуля.")
         return value
 
-class CategorySerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Category
-        fields = '__all__'
+class ProductFilterSerializer(serializers.Serializer):
+    category = serializers.IntegerField(required=False)
+    model = serializers.IntegerField(required=False)
+    size = serializers.CharField(required=False, max_length=55)
+    price_min = serializers.IntegerField(required=False)
+    price_max = serializers.IntegerField(required=False)
+    # По умолчанию лента - только активные товары (частичные индексы);
+    # is_active=false - неактивные, is_active=null - все.
+    is_active = serializers.BooleanField(required=False, allow_null=True, default=True)
+    facets = serializers.BooleanField(required=False, default=False)
+    ordering = serializers.ChoiceField(choices=["newest", "popular"], required=False, default="newest")
 
-class ModelsSerializer(serializers.ModelSerializer):
-    category_name = serializers.ReadOnlyField(source='category.title')
+class ProductBatchSerializer(serializers.Serializer):
+    uuids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=settings.PRODUCT_BATCH_MAX_SIZE,
+    )
 
-    class Meta:
-        model = Models
-        fields = '__all__'
+class ProductBulkUpdateItemSerializer(serializers.Serializer):
+    uuid = serializers.UUIDField()
+    price = serializers.IntegerField(required=False)
+    is_active = serializers.BooleanField(required=False)
+    size = serializers.CharField(required=False, max_length=55)
+    category = serializers.IntegerField(required=False, allow_null=True)
+    model = serializers.IntegerField(required=False, allow_null=True)
+
+    validate_price = ProductCreateSerializer.validate_price
+    validate_size = ProductCreateSerializer.validate_size
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    items = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.PRODUCT_BULK_UPDATE_MAX_SIZE,
+    )
+    dry_run = serializers.BooleanField(default=False)
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    category = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    offset = serializers.IntegerField(min_value=0, default=0)
+
+class ProductSearchQuerySerializer(SearchQuerySerializer):
+    is_active = serializers.BooleanField(required=False, allow_null=True, default=None)
 
 from django.contrib.auth import get_user_model
 
@@ -130,8 +246,11 @@ class ResetPasswordSerializer(serializers.Serializer):
 
     def validate(self, data):
         from .models import PasswordResetCode
-        reset_entry = PasswordResetCode.objects.filter(email=data['email'], code=data['code']).first()
-        
+        reset_entry = PasswordResetCode.objects.filter(
+            email=data['email'], code=data['code'],
+            created_at__gte=PasswordResetCode.expiry_cutoff(),
+        ).exists()
+
         if not reset_entry:
             raise serializers.ValidationError("Неверный код или email.")
         return data
\ No newline at end of file
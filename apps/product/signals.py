@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from apps.product.cache import invalidate
+from apps.product.images import IMAGE_FIELDS, image_is_referenced
+from apps.product.models import (
+    Book, Category, Models, Product, ProductImage, bulk_changed,
+)
+from apps.product.search import SEARCH_INDEXES
+
+# Модели, от которых зависят кешированные представления. Представление
+# объявляет свои зависимости в cache_depends_on, а любое изменение этих
+# моделей поднимает версию их пространства имён.
+CACHED_MODELS = (Category, Models, Product, ProductImage, Book)
+
+
+def invalidate_model_cache(sender, **kwargs):
+    invalidate(sender)
+
+
+for model in CACHED_MODELS:
+    name = model._meta.model_name
+    post_save.connect(
+        invalidate_model_cache, sender=model,
+        dispatch_uid=f"invalidate_{name}_on_save",
+    )
+    post_delete.connect(
+        invalidate_model_cache, sender=model,
+        dispatch_uid=f"invalidate_{name}_on_delete",
+    )
+
+
+def touch_product(sender, instance, **kwargs):
+    # Фото входят в представление товара, поэтому их изменение меняет
+    # и updated_at товара, по которому строятся ETag/Last-Modified.
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+post_save.connect(touch_product, sender=ProductImage, dispatch_uid="touch_product_on_image_save")
+post_delete.connect(touch_product, sender=ProductImage, dispatch_uid="touch_product_on_image_delete")
+
+
+def release_blobs(sender, instance, **kwargs):
+    # Один файл может принадлежать нескольким фото (одинаковое содержимое),
+    # поэтому удаляем его только когда ссылок на него не осталось.
+    names = {getattr(instance, field).name for field in IMAGE_FIELDS} - {""}
+
+    def release():
+        for name in names:
+            instance.image.storage.release(name, image_is_referenced)
+
+    if names:
+        transaction.on_commit(release)
+
+
+post_delete.connect(release_blobs, sender=ProductImage, dispatch_uid="release_product_image_blobs")
+
+
+def update_search_index(sender, instance, **kwargs):
+    SEARCH_INDEXES[sender].update([instance.pk])
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    SEARCH_INDEXES[sender].remove([instance.pk])
+
+
+def update_search_index_bulk(sender, pks, **kwargs):
+    SEARCH_INDEXES[sender].update(pks)
+
+
+for model in SEARCH_INDEXES:
+    name = model._meta.model_name
+    post_save.connect(update_search_index, sender=model, dispatch_uid=f"search_{name}_on_save")
+    post_delete.connect(remove_from_search_index, sender=model, dispatch_uid=f"search_{name}_on_delete")
+    bulk_changed.connect(update_search_index_bulk, sender=model, dispatch_uid=f"search_{name}_on_bulk")
@@ -0,0 +1,119 @@
+"""
+Частичные представления: ?fields=title,price и ?expand=category.
+
+fields оставляет в ответе только перечисленные поля, expand заменяет
+внешний ключ (или название) вложенным объектом; неизвестное имя в любом из
+параметров - ответ 400. Те же параметры сужают
+запрос: only() по нужным колонкам, select_related/prefetch_related только
+для запрошенных связей.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+def split_param(value):
+    return {name.strip() for name in (value or "").split(",") if name.strip()}
+
+
+def sparse_params(request):
+    """Пара множеств (fields, expand); пустые, если параметры не переданы."""
+    if request is None:
+        return set(), set()
+    params = getattr(request, "query_params", request.GET)
+    return split_param(params.get("fields")), split_param(params.get("expand"))
+
+
+def sparse_key(request):
+    fields, expand = sparse_params(request)
+    if not fields and not expand:
+        return ""
+    return f"{','.join(sorted(fields))}:{','.join(sorted(expand))}"
+
+
+class SparseFieldsMixin:
+    """
+    Параметры берутся из request в контексте; sparse_request позволяет
+    передать запрос, не переводя ссылки на файлы в абсолютные.
+
+    expandable_fields - поле -> сериализатор вложенного объекта для ?expand=.
+    method_field_sources - связи и колонки, которые читают SerializerMethodField.
+    """
+    expandable_fields = {}
+    method_field_sources = {}
+
+    def _is_top_level(self):
+        # Вложенные сериализаторы параметры запроса не сужают.
+        parent = self.parent
+        return parent is None or (
+            isinstance(parent, serializers.ListSerializer) and parent.parent is None
+        )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self._is_top_level():
+            return fields
+        requested, expand = sparse_params(
+            self.context.get("sparse_request") or self.context.get("request")
+        )
+        errors = {}
+        unknown = expand - self.expandable_fields.keys()
+        if unknown:
+            errors["expand"] = [f"Неизвестные поля: {', '.join(sorted(unknown))}."]
+        unknown = requested - {name for name, field in fields.items() if not field.write_only} - expand
+        if unknown:
+            errors["fields"] = [f"Неизвестные поля: {', '.join(sorted(unknown))}."]
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        for name in expand:
+            fields[name] = self.expandable_fields[name](read_only=True)
+        if requested:
+            keep = requested | expand
+            fields = {name: field for name, field in fields.items() if name in keep}
+        return fields
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request, required=()):
+        """
+        Сужает queryset под ?fields=/?expand=; без них возвращает как есть.
+        required - колонки, нужные представлению помимо полей ответа.
+        """
+        requested, expand = sparse_params(request)
+        if not requested and not expand:
+            return queryset
+
+        opts = queryset.model._meta
+        only, select, prefetch = {opts.pk.name, *required}, set(), set()
+        serializer = cls(context={"sparse_request": request})
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            for source in cls.method_field_sources.get(name, (field.source,)):
+                path = source.split(".")
+                try:
+                    model_field = opts.get_field(path[0])
+                except FieldDoesNotExist:
+                    continue
+                if model_field.one_to_many or model_field.many_to_many:
+                    prefetch.add(path[0])
+                elif model_field.is_relation and (len(path) > 1 or name in expand):
+                    select.add(path[0])
+                    only.add(path[0])
+                    if len(path) > 1:
+                        only.add("__".join(path))
+                    elif isinstance(field, serializers.BaseSerializer):
+                        for related_field in field.fields.values():
+                            if related_field.source == "*":
+                                continue
+                            related_path = [path[0], *related_field.source.split(".")]
+                            only.add("__".join(related_path))
+                            if len(related_path) > 2:
+                                select.add("__".join(related_path[:-1]))
+                else:
+                    only.add(model_field.name)
+
+        return (
+            queryset.select_related(None).prefetch_related(None)
+            .select_related(*select).prefetch_related(*prefetch)
+            .only(*only)
+        )
@@ -0,0 +1,112 @@
+import fcntl
+import hashlib
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+# Содержимое по имени никогда не меняется. В продакшене тот же заголовок
+# ставит веб-сервер (deploy/nginx/media.conf).
+BLOB_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранит файл под именем sha256 его содержимого: blobs/ab/<sha256>.<ext>.
+
+    Одинаковые загрузки ложатся в один файл, а содержимое по имени никогда
+    не меняется, поэтому URL можно кешировать навсегда. Файл удаляется,
+    когда на него не остаётся ссылок (release_blobs в signals.py и команда
+    collect_blobs).
+
+    Загрузка, которая переиспользует файл, и удаление файла идут под одной
+    межпроцессной блокировкой. Переиспользование обновляет mtime файла, а
+    release() не трогает файлы моложе BLOB_RELEASE_GRACE_SECONDS: запись
+    о такой загрузке могла ещё не закоммититься, и проверка ссылок её не видит.
+    """
+    blob_dir = "blobs"
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя выбирает _save по содержимому.
+        return name
+
+    @contextmanager
+    def _locked(self):
+        lock_dir = os.path.join(self.location, self.blob_dir)
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        tmp_dir = os.path.join(self.location, self.blob_dir, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        hasher = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+            if hasattr(content, "seek"):
+                content.seek(0)
+            for chunk in content.chunks():
+                hasher.update(chunk)
+                tmp.write(chunk)
+
+        digest = hasher.hexdigest()
+        name = f"{self.blob_dir}/{digest[:2]}/{digest}{extension}"
+        path = self.path(name)
+        with self._locked():
+            if os.path.exists(path):
+                os.unlink(tmp.name)
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp.name, path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+        return name
+
+    def release(self, name, is_referenced):
+        """
+        Удаляет файл, если is_referenced(name) ложно и файл не моложе
+        BLOB_RELEASE_GRACE_SECONDS. Возвращает True, если файл удалён.
+        """
+        path = self.path(name)
+        with self._locked():
+            try:
+                age = time.time() - os.path.getmtime(path)
+            except FileNotFoundError:
+                return False
+            if age < settings.BLOB_RELEASE_GRACE_SECONDS or is_referenced(name):
+                return False
+            os.unlink(path)
+        return True
+
+    def blob_names(self):
+        """Имена всех файлов-блобов (без временных)."""
+        root = self.path(self.blob_dir)
+        for directory, subdirs, files in os.walk(root):
+            if directory == root:
+                subdirs[:] = [d for d in subdirs if d != "tmp"]
+                continue
+            for filename in files:
+                yield os.path.relpath(os.path.join(directory, filename), self.location).replace(os.sep, "/")
+
+    def stale_tmp_files(self):
+        """Временные файлы оборванных загрузок старше BLOB_RELEASE_GRACE_SECONDS."""
+        tmp_dir = self.path(f"{self.blob_dir}/tmp")
+        if not os.path.isdir(tmp_dir):
+            return
+        cutoff = time.time() - settings.BLOB_RELEASE_GRACE_SECONDS
+        for entry in os.scandir(tmp_dir):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                yield entry.path
+
+
+def product_image_storage():
+    return ContentAddressedStorage()
@@ -1,3 +1,1414 @@
-from django.test import TestCase
+import base64
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from itertools import islice
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection, connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.views import View
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+
+from apps.product.archive import archive_products, restore_products
+from apps.product.benchmark import check_budgets, compare, run_suite
+from apps.product.cache import clear_local, get_or_build, get_versions, local_cache, namespace_for, version_key
+from apps.product.exporters import BOOK_EXPORT_FIELDS, PRODUCT_EXPORT_FIELDS
+from apps.product.filters import get_facets
+from apps.product.fragments import DETAIL_NAMESPACES, detail_fragment_key, list_fragment_key
+from apps.product.images import generate_derivatives
+from apps.product.mail import deliver_outbox, enqueue_mail
+from apps.product.metrics import PerformanceMiddleware, registry
+from apps.product.models import ArchivedProduct, ArchivedProductImage, Book, Category, EmailOutbox, Models, PasswordResetCode, Product, ProductImage, ProductStats
+from apps.product.pagination import encode_cursor
+from apps.product.popularity import flush_views, refresh_ranking, take_buffer
+from apps.product.search import product_index
+from apps.product.seed import CatalogSeeder
+from apps.product.serializers import ProductSerializer, product_list_rows, product_list_values
+from apps.product.views import ExportAPIView, serve_blob
+from core.cache_backends import SQLiteCache
+from core.db_router import PIN_COOKIE, PRIMARY, REPLICA, ReplicaReadMixin, use_primary, use_replica
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, POPULARITY_FLUSH_INTERVAL=3600)
+class CachedTestCase(TestCase):
+    """Кеш в памяти процесса, пустой в начале каждого теста, как и буфер просмотров."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        clear_local()
+        take_buffer()
+        self.addCleanup(take_buffer)
+
+
+def create_catalog(count, images_per_product=2):
+    category = Category.objects.create(title="Обувь")
+    products = [
+        Product.objects.create(
+            category=category, title=f"Товар {i}", description="Описание",
+            price=100 + i, size="42",
+        )
+        for i in range(count)
+    ]
+    for product in products[::2]:
+        for n in range(images_per_product):
+            ProductImage.objects.create(product=product, image=f"products/{product.pk}_{n}.jpg")
+    return products
+
+
+class ProductListFastPathTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        create_catalog(30)
+
+    def test_matches_product_serializer(self):
+        queryset = Product.objects.order_by("-created_at", "-id")
+        expected = ProductSerializer(
+            queryset.prefetch_related("images"), many=True
+        ).data
+        fast = product_list_rows(product_list_values(queryset))
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+
+    def test_constant_query_count(self):
+        for page_size in (5, 30):
+            local_cache.clear()
+            # Страница id и один запрос на недостающие фрагменты.
+            with self.assertNumQueries(2):
+                response = self.client.get(
+                    "/api/v1/products/products/", {"page_size": page_size}
+                )
+            self.assertEqual(len(response.json()["results"]), page_size)
+
+
+class KeysetPaginationTests(CachedTestCase):
+    url = "/api/v1/products/products/"
+
+    def setUp(self):
+        super().setUp()
+        self.products = create_catalog(7)
+        # Половина товаров с одинаковым created_at: порядок решает id.
+        created_at = timezone.now() - timedelta(days=1)
+        Product.objects.filter(pk__in=[p.pk for p in self.products[:4]]).update(created_at=created_at)
+
+    def walk(self, page_size):
+        pages = []
+        response = self.client.get(self.url, {"page_size": page_size})
+        while True:
+            body = response.json()
+            pages.append([row["uuid"] for row in body["results"]])
+            if body["next"] is None:
+                return pages
+            response = self.client.get(body["next"])
+
+    def test_pages_follow_order_across_ties(self):
+        expected = [
+            str(value) for value in
+            Product.objects.order_by("-created_at", "-id").values_list("uuid", flat=True)
+        ]
+        pages = self.walk(page_size=3)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_last_full_page_has_no_next(self):
+        pages = self.walk(page_size=7)
+        self.assertEqual([len(page) for page in pages], [7])
+
+    def test_bad_cursor_is_not_found(self):
+        wrong_shape = base64.urlsafe_b64encode(b'{"a": 1}').decode()
+        for cursor in ("garbage", wrong_shape, encode_cursor(timezone.now(), 1)[:-3]):
+            response = self.client.get(self.url, {"cursor": cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+class GetOrBuildTests(CachedTestCase):
+    key = "get_or_build_test:list"
+    lock_key = f"{key}:lock"
+
+    def setUp(self):
+        super().setUp()
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return f"значение {self.builds}"
+
+    def get(self, **kwargs):
+        return get_or_build(self.key, self.build, depends_on=(Category,), **kwargs)
+
+    def expire_soft_ttl(self, hard_ttl=None):
+        entry = {**cache.get(self.key), "fresh_until": 0}
+        cache.set(self.key, entry, timeout=hard_ttl or settings.CACHE_HARD_TTL)
+        local_cache.clear()
+
+    def test_single_flight_waits_for_lock_owner(self):
+        self.get()
+        entry = cache.get(self.key)
+        cache.delete(self.key)
+        local_cache.clear()
+        cache.add(self.lock_key, 1)
+        with mock.patch("apps.product.cache._wait_for_entry", return_value=entry) as wait:
+            self.assertEqual(self.get(), "значение 1")
+        wait.assert_called_once()
+        self.assertEqual(self.builds, 1)
+        self.assertIsNotNone(cache.get(self.lock_key))
+
+    def test_wait_timeout_keeps_foreign_lock(self):
+        cache.add(self.lock_key, 1)
+        with mock.patch("apps.product.cache._wait_for_entry", return_value=None):
+            self.assertEqual(self.get(), "значение 1")
+        # Блокировку держит другой запрос - её снимет он сам.
+        self.assertIsNotNone(cache.get(self.lock_key))
+
+    def test_stale_while_revalidate(self):
+        self.get()
+        self.expire_soft_ttl()
+        cache.add(self.lock_key, 1)
+        self.assertEqual(self.get(), "значение 1")
+        self.assertEqual(self.builds, 1)
+
+        cache.delete(self.lock_key)
+        self.assertEqual(self.get(), "значение 2")
+        self.assertIsNone(cache.get(self.lock_key))
+
+    def test_stale_entry_expires_after_hard_ttl(self):
+        self.get(hard_ttl=60)
+        self.expire_soft_ttl(hard_ttl=60)
+        cache.add(self.lock_key, 1)
+        later = mock.Mock(time=mock.Mock(return_value=timezone.now().timestamp() + 61))
+        with mock.patch("django.core.cache.backends.locmem.time", later), \
+                mock.patch("apps.product.cache._wait_for_entry", return_value=None):
+            # Старое значение больше не отдаётся - запрос строит новое сам.
+            self.assertEqual(self.get(hard_ttl=60), "значение 2")
+        self.assertIsNotNone(cache.get(self.lock_key))
+
+
+@override_settings(CACHE_VERSION_CHECK_INTERVAL=60)
+class LocalCacheTests(CachedTestCase):
+    key = "local_cache_test:list"
+
+    def setUp(self):
+        super().setUp()
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return f"значение {self.builds}"
+
+    def get(self):
+        return get_or_build(self.key, self.build, depends_on=(Category,))
+
+    def test_hit_does_not_reach_shared_cache(self):
+        self.assertEqual(self.get(), "значение 1")
+        with mock.patch("apps.product.cache.cache") as shared:
+            self.assertEqual(self.get(), "значение 1")
+        self.assertEqual(shared.mock_calls, [])
+        self.assertEqual(self.builds, 1)
+
+    def test_version_bump_in_process_drops_entry(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(title="Обувь")
+        # Сверка с L2 ещё не нужна, но своя версия уже новая.
+        self.assertEqual(self.get(), "значение 2")
+
+    def test_foreign_bump_seen_after_check_interval(self):
+        self.get()
+        # Версию поднял другой процесс: до сверки L1 отдаёт прежнее значение.
+        cache.incr(version_key(namespace_for(Category)))
+        self.assertEqual(self.get(), "значение 1")
+
+        later = time.time() + settings.CACHE_VERSION_CHECK_INTERVAL
+        with mock.patch("apps.product.cache.time.time", return_value=later):
+            self.assertEqual(self.get(), "значение 2")
+
+
+class CacheInvalidationTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(title="Обувь")
+        model = Models.objects.create(title="Модель", category=self.category)
+        self.product = Product.objects.create(
+            category=self.category, model=model, title="Товар",
+            description="Описание", price=100, size="42",
+        )
+        self.detail_url = f"/api/v1/products/products/{self.product.uuid}/"
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_product_save_refreshes_list_and_detail(self):
+        list_before = self.get("/api/v1/products/products/")
+        detail_before = self.get(self.detail_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = "Новое название"
+            self.product.save()
+
+        list_after = self.get("/api/v1/products/products/")
+        detail_after = self.get(self.detail_url)
+        self.assertEqual(list_after.json()["results"][0]["title"], "Новое название")
+        self.assertEqual(detail_after.json()["title"], "Новое название")
+        self.assertNotEqual(list_after["ETag"], list_before["ETag"])
+        self.assertNotEqual(detail_after["ETag"], detail_before["ETag"])
+
+    def test_category_rename_refreshes_dependent_views(self):
+        categories_before = self.get("/api/v1/products/categories/")
+        detail_before = self.get(self.detail_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.title = "Сапоги"
+            self.category.save()
+
+        categories_after = self.get("/api/v1/products/categories/")
+        detail_after = self.get(self.detail_url)
+        self.assertEqual(categories_after.json()[0]["title"], "Сапоги")
+        self.assertEqual(detail_after.json()["category_title"], "Сапоги")
+        self.assertNotEqual(categories_after["ETag"], categories_before["ETag"])
+        self.assertNotEqual(detail_after["ETag"], detail_before["ETag"])
+
+    def test_versions_bump_only_after_commit(self):
+        before = self.get("/api/v1/products/categories/")
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.category.title = "Сапоги"
+            self.category.save()
+        # До коммита кеш отдаёт старые данные: новых ещё никто не видит.
+        self.assertEqual(self.get("/api/v1/products/categories/")["ETag"], before["ETag"])
+
+        for callback in callbacks:
+            callback()
+        after = self.get("/api/v1/products/categories/")
+        self.assertEqual(after.json()[0]["title"], "Сапоги")
+        self.assertNotEqual(after["ETag"], before["ETag"])
+
+
+def sqlite_cache_worker(path):
+    backend = SQLiteCache(path, {})
+    for _ in range(50):
+        backend.incr("counter")
+    return backend.add("lock", os.getpid())
+
+
+class FragmentRegenerationTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(title="Обувь")
+        self.model = Models.objects.create(title="Модель", category=self.category)
+        self.product = Product.objects.create(
+            category=self.category, model=self.model, title="Товар",
+            description="Описание", price=100, size="42",
+        )
+        self.detail_url = f"/api/v1/products/products/{self.product.uuid}/"
+
+    def keys(self):
+        pk, uuid, updated_at = Product.objects.values_list("pk", "uuid", "updated_at").get(pk=self.product.pk)
+        return (
+            list_fragment_key(pk, updated_at),
+            detail_fragment_key(uuid, updated_at, get_versions(DETAIL_NAMESPACES)),
+        )
+
+    def render(self):
+        self.assertEqual(self.client.get("/api/v1/products/products/").status_code, 200)
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        keys = self.keys()
+        self.assertEqual(list(cache.get_many(keys)), list(keys))
+        return keys, response.json()
+
+    def test_product_save(self):
+        before, _ = self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = "Новое название"
+            self.product.save()
+        after, detail = self.render()
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+        self.assertEqual(detail["title"], "Новое название")
+
+    def test_image_change(self):
+        before, _ = self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.product, image="products/new.jpg")
+        after, detail = self.render()
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+        self.assertEqual(len(detail["images"]), 1)
+
+    def test_category_and_model_bump(self):
+        for related, field, title in (
+            (self.category, "category_title", "Сапоги"), (self.model, "model_title", "Новая модель"),
+        ):
+            before, _ = self.render()
+            with self.captureOnCommitCallbacks(execute=True):
+                related.title = title
+                related.save()
+            after, detail = self.render()
+            # Товар не менялся: фрагмент списка прежний, детальный - новый.
+            self.assertEqual(after[0], before[0])
+            self.assertNotEqual(after[1], before[1])
+            self.assertEqual(detail[field], title)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "cache.sqlite3")
+        self.now = time.time()
+        clock = mock.patch("core.cache_backends.time", mock.Mock(time=lambda: self.now))
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def backend(self, **options):
+        return SQLiteCache(self.path, {"OPTIONS": options})
+
+    def test_incr_and_add_are_atomic_across_processes(self):
+        backend = self.backend()
+        backend.set("counter", 0)
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            added = pool.map(sqlite_cache_worker, [self.path] * 4)
+        self.assertEqual(backend.get("counter"), 200)
+        self.assertEqual(added.count(True), 1)
+
+    def test_expiry(self):
+        backend = self.backend()
+        backend.set("short", 1, timeout=60)
+        backend.set("forever", 2, timeout=None)
+        backend.set("zero", 3, timeout=0)
+        self.assertIsNone(backend.get("zero"))
+        self.assertEqual(backend.get("short"), 1)
+
+        self.now += 61
+        self.assertIsNone(backend.get("short"))
+        self.assertFalse(backend.has_key("short"))
+        self.assertEqual(backend.get("forever"), 2)
+        with self.assertRaises(ValueError):
+            backend.incr("short")
+        # Просроченный ключ не мешает add.
+        self.assertTrue(backend.add("short", 4))
+        self.assertFalse(backend.add("short", 5))
+        self.assertEqual(backend.get("short"), 4)
+
+    def test_touch(self):
+        backend = self.backend()
+        backend.set("key", 1, timeout=60)
+        self.assertTrue(backend.touch("key", timeout=120))
+        self.assertFalse(backend.touch("missing"))
+
+        self.now += 61
+        self.assertEqual(backend.get("key"), 1)
+        self.now += 60
+        self.assertIsNone(backend.get("key"))
+        self.assertFalse(backend.touch("key"))
+
+    def test_culls_least_recently_read(self):
+        backend = self.backend(MAX_ENTRIES=4, CULL_FREQUENCY=2)
+        for key in "abcd":
+            backend.set(key, key)
+            self.now += 2
+        backend.get("a")
+        self.now += 2
+        backend.set("e", "e")
+        self.assertEqual(
+            backend.get_many("abcde"), {"a": "a", "d": "d", "e": "e"},
+        )
+
+
+class SearchIndexTests(TestCase):
+    def test_update_and_remove_in_chunks(self):
+        products = create_catalog(7)
+        pks = [product.pk for product in products]
+        Product.objects.filter(pk__in=pks[:3]).update(title="Ботинки")
+        with mock.patch.object(product_index, "chunk_size", 2):
+            product_index.update([*pks, 10_000])
+            self.assertEqual(sorted(product_index.search("Ботинки")), pks[:3])
+            self.assertEqual(len(product_index.search("Товар")), 4)
+
+            product_index.remove(pks[1:])
+            self.assertEqual(product_index.search("Ботинки"), pks[:1])
+            self.assertEqual(product_index.search("Товар"), [])
+
+    def test_failed_rebuild_keeps_old_index(self):
+        products = create_catalog(5)
+        self.assertEqual(product_index.rebuild(batch_size=2), 5)
+        insert = product_index._insert
+        calls = []
+
+        def failing_insert(cursor, rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError("диск переполнен")
+            insert(cursor, rows)
+
+        with mock.patch.object(product_index, "_insert", failing_insert):
+            with self.assertRaises(RuntimeError):
+                product_index.rebuild(batch_size=2)
+        # Без транзакции в индексе осталась бы только первая пачка.
+        self.assertEqual(sorted(product_index.search("Товар")), [product.pk for product in products])
+
+
+class ConditionalGetTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = create_catalog(3)[0]
+        self.urls = (
+            "/api/v1/products/products/",
+            f"/api/v1/products/products/{self.product.uuid}/",
+            "/api/v1/products/categories/",
+        )
+
+    def test_repeat_request_is_not_modified(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response["ETag"])
+
+            repeat = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(repeat.status_code, 304, url)
+            self.assertEqual(repeat.content, b"")
+            self.assertEqual(repeat["ETag"], response["ETag"])
+
+            repeat = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(repeat.status_code, 304, url)
+
+    def test_async_repeat_request_is_not_modified(self):
+        get = async_to_sync(self.async_client.get)
+        response = get("/api/v1/products/async/products/")
+        repeat = get("/api/v1/products/async/products/", headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(repeat.status_code, 304)
+
+    def test_write_changes_etag(self):
+        etags = {url: self.client.get(url)["ETag"] for url in self.urls}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.category.title = "Сапоги"
+            self.product.category.save()
+            self.product.title = "Новое название"
+            self.product.save()
+
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response["ETag"], etag)
+
+
+class ProductBulkUpdateTests(CachedTestCase):
+    url = "/api/v1/products/products/bulk-update/"
+
+    def setUp(self):
+        super().setUp()
+        self.products = create_catalog(3)
+        self.other = Category.objects.create(title="Одежда")
+
+    def post(self, items, dry_run=False):
+        return self.client.post(
+            self.url, {"items": items, "dry_run": dry_run}, content_type="application/json"
+        )
+
+    def prices(self):
+        return list(Product.objects.order_by("pk").values_list("price", flat=True))
+
+    def test_update(self):
+        first, second, third = self.products
+        response = self.post([
+            {"uuid": str(first.uuid), "price": 999, "is_active": False},
+            {"uuid": str(second.uuid), "price": second.price},
+            {"uuid": str(third.uuid), "category": self.other.pk},
+        ])
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report["applied"], report["updated"], report["unchanged"]), (True, 2, 1))
+        self.assertEqual(
+            [result["status"] for result in report["results"]], ["updated", "unchanged", "updated"]
+        )
+        first.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual((first.price, first.is_active), (999, False))
+        self.assertEqual(third.category_id, self.other.pk)
+
+    def test_dry_run_changes_nothing(self):
+        prices = self.prices()
+        response = self.post([{"uuid": str(self.products[0].uuid), "price": 999}], dry_run=True)
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report["dry_run"], report["applied"], report["updated"]), (True, False, 1))
+        self.assertEqual(report["results"][0]["changes"], {"price": 999})
+        self.assertEqual(self.prices(), prices)
+
+    def test_row_errors(self):
+        first, second, _ = self.products
+        model = Models.objects.create(title="Модель", category=first.category)
+        response = self.post([
+            {"uuid": str(first.uuid), "price": 0},
+            {"uuid": "00000000-0000-4000-8000-000000000000", "price": 10},
+            {"uuid": str(second.uuid), "category": self.other.pk, "model": model.pk},
+            {"uuid": str(second.uuid), "price": 10},
+            {"uuid": str(first.uuid), "model": 10_000},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = {result["row"]: result["errors"] for result in response.json()["results"]}
+        self.assertEqual(sorted(errors), [1, 2, 3, 4, 5])
+        self.assertIn("price", errors[1])
+        self.assertEqual(errors[2], {"uuid": ["Товар не найден."]})
+        self.assertIn("non_field_errors", errors[3])
+        self.assertEqual(errors[4], {"uuid": ["Товар указан несколько раз."]})
+        self.assertEqual(errors[5], {"model": ["Модель не найдена."]})
+
+    def test_partial_failure_applies_nothing(self):
+        prices = self.prices()
+        response = self.post([
+            {"uuid": str(self.products[0].uuid), "price": 999},
+            {"uuid": str(self.products[1].uuid), "price": -1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        report = response.json()
+        self.assertEqual((report["applied"], report["updated"], report["failed"]), (False, 1, 1))
+        self.assertEqual(self.prices(), prices)
+
+    def test_invalid_payload(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        response = self.client.post(self.url, {"items": "нет"}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class ContentAddressedStorageTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, BLOB_RELEASE_GRACE_SECONDS=0))
+        self.product = create_catalog(1)[0]
+        self.storage = ProductImage._meta.get_field("image").storage
+
+    def upload(self, content, name="photo.JPG"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ProductImage.objects.create(
+                product=self.product, image=SimpleUploadedFile(name, content)
+            )
+
+    def delete(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+
+    def test_same_content_is_stored_once(self):
+        first = self.upload(b"one")
+        second = self.upload(b"one", name="copy.jpg")
+        other = self.upload(b"two")
+
+        digest = hashlib.sha256(b"one").hexdigest()
+        self.assertEqual(first.image.name, f"blobs/{digest[:2]}/{digest}.jpg")
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertNotEqual(other.image.name, first.image.name)
+        self.assertEqual(sorted(self.storage.blob_names()), sorted([first.image.name, other.image.name]))
+        with self.storage.open(first.image.name) as blob:
+            self.assertEqual(blob.read(), b"one")
+
+    def test_blob_is_removed_with_last_reference(self):
+        first = self.upload(b"one")
+        second = self.upload(b"one")
+        name = first.image.name
+
+        self.delete(first)
+        self.assertTrue(self.storage.exists(name))
+        self.delete(second)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_reused_blob_is_not_released_during_grace_period(self):
+        name = self.upload(b"one").image.name
+        path = self.storage.path(name)
+        os.utime(path, (0, 0))
+        # Повторная загрузка того же содержимого продлевает жизнь файла:
+        # её запись может быть ещё не закоммичена.
+        self.storage.save("again.jpg", ContentFile(b"one"))
+        with override_settings(BLOB_RELEASE_GRACE_SECONDS=3600):
+            self.assertFalse(self.storage.release(name, lambda name: False))
+        self.assertTrue(os.path.exists(path))
+
+    def test_serve_blob_is_immutable(self):
+        name = self.upload(b"one").image.name
+        response = serve_blob(RequestFactory().get("/"), name.removeprefix("blobs/"))
+        self.assertEqual(b"".join(response.streaming_content), b"one")
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+
+    def test_collect_blobs(self):
+        kept = self.upload(b"one").image.name
+        orphan = self.storage.save("orphan.jpg", ContentFile(b"two"))
+        call_command("collect_blobs", stdout=StringIO())
+        self.assertTrue(self.storage.exists(kept))
+        self.assertFalse(self.storage.exists(orphan))
+
+
+class ExportTests(CachedTestCase):
+    url = "/api/v1/products/products/export/"
+
+    def setUp(self):
+        super().setUp()
+        self.products = create_catalog(3)
+
+    def export(self, url=None, **params):
+        response = self.client.get(url or self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode(), response
+
+    def records(self, **params):
+        content, _ = self.export(**params)
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_ndjson(self):
+        content, response = self.export()
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        self.assertIn('filename="products.ndjson"', response["Content-Disposition"])
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([record["uuid"] for record in records], [str(p.uuid) for p in self.products])
+        self.assertEqual(set(records[0]), {*PRODUCT_EXPORT_FIELDS, "images", "cursor"})
+        self.assertEqual(len(records[0]["images"]), 2)
+        self.assertEqual(records[1]["images"], [])
+
+    def test_csv(self):
+        content, response = self.export(format="csv")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        header, *rows = csv.reader(StringIO(content))
+        self.assertEqual(header, [*PRODUCT_EXPORT_FIELDS, "images", "cursor"])
+        self.assertEqual([row[1] for row in rows], [str(p.uuid) for p in self.products])
+        self.assertEqual(len(rows[0][header.index("images")].split("|")), 2)
+
+    def test_resume_from_cursor(self):
+        first, *rest = self.records()
+        resumed = self.records(cursor=first["cursor"])
+        self.assertEqual(resumed, rest)
+        self.assertEqual(self.records(cursor=rest[-1]["cursor"]), [])
+
+    def test_bad_cursor_is_not_found(self):
+        response = self.client.get(self.url, {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_books(self):
+        for title in ("Первая", "Вторая"):
+            Book.objects.create(title=title, author="Автор", price=10, published_date=date(2000, 1, 1))
+        content, response = self.export("/api/v1/products/books/export/")
+        self.assertIn('filename="books.ndjson"', response["Content-Disposition"])
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([record["title"] for record in records], ["Первая", "Вторая"])
+        self.assertEqual(set(records[0]), {*BOOK_EXPORT_FIELDS, "cursor"})
+
+        content, _ = self.export("/api/v1/products/books/export/", format="csv")
+        self.assertEqual(next(csv.reader(StringIO(content))), [*BOOK_EXPORT_FIELDS, "cursor"])
+
+    def test_records_function_is_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ExportAPIView.as_view()
+
+
+class PerformanceMetricsTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = create_catalog(2)
+        self.detail_url = f"/api/v1/products/products/{self.products[0].uuid}/"
+
+    def server_timing(self, response):
+        return dict(
+            (part.split(";", 1) + [""])[:2]
+            for part in response["Server-Timing"].split(", ")
+        )
+
+    def test_server_timing(self):
+        timing = self.server_timing(self.client.get(self.detail_url))
+        self.assertEqual(set(timing), {"db", "cache", "serialize", "total"})
+        self.assertRegex(timing["db"], r'^dur=[\d.]+;desc="[1-9]\d* queries"$')
+        self.assertIn("product_fragment:miss=1", timing["cache"])
+
+        timing = self.server_timing(self.client.get(self.detail_url))
+        self.assertIn("product_fragment:hit=1", timing["cache"])
+
+        response = self.client.post(
+            "/api/v1/products/products/batch/",
+            {"uuids": [str(p.uuid) for p in self.products]}, content_type="application/json",
+        )
+        self.assertIn("product_fragment:hit=1 product_fragment:miss=1", self.server_timing(response)["cache"])
+
+    def test_prometheus_format(self):
+        self.client.get(self.detail_url)
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        lines = response.content.decode().splitlines()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", lines)
+        self.assertIn("# TYPE http_requests_total counter", lines)
+        labels = 'view="product-detail",method="GET"'
+        self.assertTrue(any(line.startswith(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} ') for line in lines))
+        self.assertTrue(any(line.startswith(f"http_request_duration_seconds_count{{{labels}}} ") for line in lines))
+        self.assertTrue(any(line.startswith('cache_events_total{namespace="product_fragment",event="miss"} ') for line in lines))
+        sample = re.compile(r'^[a-z_]+\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\} [0-9.e+-]+$')
+        for line in lines:
+            if not line.startswith("# TYPE "):
+                self.assertRegex(line, sample)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_access(self):
+        outside = {"REMOTE_ADDR": "10.0.0.1"}
+        self.assertEqual(self.client.get("/metrics", **outside).status_code, 403)
+        self.assertEqual(
+            self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong", **outside).status_code, 403
+        )
+        self.assertEqual(
+            self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret", **outside).status_code, 200
+        )
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ", **outside).status_code, 403)
+
+    def test_streaming_response_is_measured_on_close(self):
+        labels = 'view="product-export",method="GET"'
+        queries = registry.counters[("http_request_db_queries_total", labels)]
+        size = registry.counters[("http_response_bytes_total", labels)]
+
+        response = self.client.get("/api/v1/products/products/export/")
+        body = b"".join(response.streaming_content)
+        # Записи и фото читаются двумя запросами уже при чтении тела.
+        self.assertEqual(registry.counters[("http_request_db_queries_total", labels)] - queries, 2)
+        self.assertEqual(registry.counters[("http_response_bytes_total", labels)] - size, len(body))
+
+    def repeated_queries(self, request):
+        for _ in range(3):
+            list(Product.objects.filter(pk=self.products[0].pk))
+        return HttpResponse()
+
+    @override_settings(PERF_DETECTOR=True, PERF_N_PLUS_ONE_THRESHOLD=3, PERF_SLOW_QUERY_MS=0)
+    def test_detector_reports_repeats_and_slow_queries(self):
+        middleware = PerformanceMiddleware(self.repeated_queries)
+        with self.assertLogs("apps.product.performance", "WARNING") as logs:
+            middleware(RequestFactory().get("/"))
+        messages = "\n".join(logs.output)
+        self.assertIn("Возможный N+1 в unresolved: 3 одинаковых запросов", messages)
+        self.assertEqual(messages.count("Медленный запрос в unresolved"), 3)
+
+    @override_settings(PERF_N_PLUS_ONE_THRESHOLD=3, PERF_SLOW_QUERY_MS=0)
+    def test_detector_is_opt_in(self):
+        with override_settings(PERF_DETECTOR=False), self.assertNoLogs("apps.product.performance"):
+            PerformanceMiddleware(self.repeated_queries)(RequestFactory().get("/"))
+
+
+def jpeg_file(name="photo.jpg", size=(200, 100), color="red"):
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, "JPEG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+@override_settings(
+    PRODUCT_IMAGE_WORKERS=0, PRODUCT_THUMBNAIL_SIZE=(32, 32), PRODUCT_WEBP_MAX_SIZE=(64, 64),
+)
+class ProductImageDerivativeTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.category = Category.objects.create(title="Обувь")
+
+    def assertDerivatives(self, image):
+        image.refresh_from_db()
+        self.assertTrue(image.thumbnail.name.endswith(".jpg"))
+        self.assertTrue(image.webp.name.endswith(".webp"))
+        with Image.open(image.thumbnail.path) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ("JPEG", (32, 32)))
+        with Image.open(image.webp.path) as webp:
+            self.assertEqual((webp.format, webp.size), ("WEBP", (64, 32)))
+
+    def test_create_builds_derivatives_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/v1/products/products/create/", {
+                "category": self.category.pk, "title": "Кеды", "description": "Описание",
+                "price": 100, "size": "42", "uploaded_images": [jpeg_file()],
+            })
+        self.assertEqual(response.status_code, 201)
+        image = ProductImage.objects.get()
+        self.assertDerivatives(image)
+
+        detail = self.client.get(f"/api/v1/products/products/{image.product.uuid}/").json()
+        self.assertEqual(detail["images"][0]["thumbnail"], image.thumbnail.url)
+        self.assertEqual(detail["images"][0]["webp"], image.webp.url)
+        product = Product.objects.prefetch_related("images").get()
+        self.assertEqual(ProductSerializer(product).data["first_image_thumbnail"], image.thumbnail.url)
+        listed = self.client.get("/api/v1/products/products/").json()["results"][0]
+        self.assertEqual(listed["first_image_thumbnail"], image.thumbnail.url)
+
+    def test_derivatives_bump_updated_at(self):
+        product = Product.objects.create(
+            category=self.category, title="Кеды", description="Описание", price=100, size="42",
+        )
+        image = ProductImage.objects.create(product=product, image=jpeg_file())
+        past = timezone.now() - timedelta(days=1)
+        Product.objects.filter(pk=product.pk).update(updated_at=past)
+
+        self.assertEqual(generate_derivatives([image.pk]), 1)
+        self.assertDerivatives(image)
+        product.refresh_from_db()
+        self.assertGreater(product.updated_at, past)
+
+    def test_broken_image_is_skipped(self):
+        product = Product.objects.create(
+            category=self.category, title="Кеды", description="Описание", price=100, size="42",
+        )
+        broken = ProductImage.objects.create(
+            product=product, image=SimpleUploadedFile("broken.jpg", b"not an image"),
+        )
+        image = ProductImage.objects.create(product=product, image=jpeg_file(color="blue"))
+        with self.assertLogs("apps.product.images", "ERROR"):
+            self.assertEqual(generate_derivatives([broken.pk, image.pk]), 1)
+        broken.refresh_from_db()
+        self.assertEqual(broken.thumbnail.name, "")
+        self.assertDerivatives(image)
+
+    def test_generate_thumbnails_command(self):
+        product = Product.objects.create(
+            category=self.category, title="Кеды", description="Описание", price=100, size="42",
+        )
+        images = [
+            ProductImage.objects.create(product=product, image=jpeg_file(color=color))
+            for color in ("red", "green", "blue")
+        ]
+        out = StringIO()
+        call_command("generate_thumbnails", workers=0, batch_size=2, stdout=out)
+        self.assertIn("обработано фото: 3", out.getvalue())
+        for image in images:
+            self.assertDerivatives(image)
+
+
+class SparseFieldsTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(title="Обувь")
+        self.model = Models.objects.create(title="Модель", category=self.category)
+        for i in range(3):
+            self.product = Product.objects.create(
+                category=self.category, model=self.model, title=f"Товар {i}",
+                description="Описание", price=100 + i, size="42",
+            )
+            ProductImage.objects.create(product=self.product, image=f"products/{i}.jpg")
+        Book.objects.create(
+            title="Книга", author="Автор", price=10, published_date=date(2000, 1, 1), category=self.category,
+        )
+        self.detail_url = f"/api/v1/products/products/{self.product.uuid}/"
+
+    def get(self, url, queries, **params):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(captured), queries, [q["sql"] for q in captured])
+        return response.json(), [query["sql"] for query in captured]
+
+    def test_product_list(self):
+        body, (sql,) = self.get("/api/v1/products/products/", 1, fields="title,price")
+        self.assertEqual(body["results"][0], {"title": "Товар 2", "price": 102})
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn("product_productimage", sql)
+
+        body, (_, images) = self.get("/api/v1/products/products/", 2, fields="title,first_image")
+        self.assertEqual(set(body["results"][0]), {"title", "first_image"})
+        self.assertIn("product_productimage", images)
+
+    def test_product_detail(self):
+        body, (_, sql) = self.get(self.detail_url, 2, fields="title,price")
+        self.assertEqual(body, {"title": "Товар 2", "price": 102})
+        self.assertNotIn("product_category", sql)
+        self.assertNotIn('"description"', sql)
+
+        body, (_, sql) = self.get(self.detail_url, 2, fields="title", expand="category,model")
+        self.assertEqual(body["category"], {"id": self.category.pk, "title": "Обувь"})
+        self.assertEqual(body["model"]["title"], "Модель")
+        self.assertIn("JOIN \"product_category\"", sql)
+        self.assertIn("JOIN \"product_models\"", sql)
+
+    def test_books(self):
+        body, (sql,) = self.get("/api/v1/products/books/", 1, fields="title")
+        self.assertEqual(body, [{"title": "Книга"}])
+        self.assertNotIn('"author"', sql)
+
+        body, (sql,) = self.get("/api/v1/products/books/", 1, fields="title", expand="category")
+        self.assertEqual(body, [{"title": "Книга", "category": {"id": self.category.pk, "title": "Обувь"}}])
+        self.assertIn("JOIN \"product_category\"", sql)
+
+    def test_categories_and_models(self):
+        body, _ = self.get("/api/v1/products/categories/", 1, fields="title")
+        self.assertEqual(body, [{"title": "Обувь"}])
+
+        body, (sql,) = self.get("/api/v1/products/models/", 1, fields="title", expand="category")
+        self.assertEqual(body, [{"title": "Модель", "category": {"id": self.category.pk, "title": "Обувь"}}])
+        self.assertIn("JOIN \"product_category\"", sql)
+
+    def test_unknown_names_are_rejected(self):
+        for url in ("/api/v1/products/products/", self.detail_url, "/api/v1/products/async/products/"):
+            response = self.client.get(url, {"fields": "title,nope,bad"})
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.json(), {"fields": ["Неизвестные поля: bad, nope."]})
+
+        response = self.client.get("/api/v1/products/models/", {"expand": "title"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"expand": ["Неизвестные поля: title."]})
+
+
+class FacetTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.shoes = Category.objects.create(title="Обувь")
+        self.bags = Category.objects.create(title="Сумки")
+        for category, size, price in (
+            (self.shoes, "42", 100), (self.shoes, "42", 300),
+            (self.shoes, "43", 200), (self.bags, "42", 500),
+        ):
+            Product.objects.create(
+                category=category, title="Товар", description="Описание", price=price, size=size,
+            )
+
+    def test_counts_follow_other_filters(self):
+        response = self.client.get(
+            "/api/v1/products/products/",
+            {"facets": "true", "category": self.shoes.pk, "size": "42"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 2)
+        facets = response.json()["facets"]
+        # Фасет категории не учитывает свой фильтр, но учитывает размер.
+        self.assertEqual(facets["category"], [
+            {"value": self.shoes.pk, "count": 2}, {"value": self.bags.pk, "count": 1},
+        ])
+        self.assertEqual(facets["size"], [{"value": "42", "count": 2}, {"value": "43", "count": 1}])
+        self.assertEqual(facets["is_active"], [{"value": True, "count": 2}])
+        self.assertEqual(float(facets["price"]["min"]), 100)
+        self.assertEqual(float(facets["price"]["max"]), 300)
+
+    def test_no_facets_by_default(self):
+        self.assertNotIn("facets", self.client.get("/api/v1/products/products/").json())
+
+    def test_cached_until_product_write(self):
+        filters = {"size": "43"}
+        self.assertEqual(get_facets(filters)["category"], [{"value": self.shoes.pk, "count": 1}])
+        with self.assertNumQueries(0):
+            get_facets(filters)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                category=self.bags, title="Товар", description="Описание", price=50, size="43",
+            )
+        facets = get_facets(filters)
+        self.assertEqual(facets["category"], [
+            {"value": self.shoes.pk, "count": 1}, {"value": self.bags.pk, "count": 1},
+        ])
+        self.assertEqual(float(facets["price"]["min"]), 50)
+
+
+class ProductBatchTests(CachedTestCase):
+    url = "/api/v1/products/products/batch/"
+
+    def setUp(self):
+        super().setUp()
+        self.products = create_catalog(6)
+
+    def post(self, uuids):
+        return self.client.post(self.url, {"uuids": [str(u) for u in uuids]}, content_type="application/json")
+
+    def test_order_duplicates_and_missing(self):
+        first, second = self.products[:2]
+        missing = uuid.uuid4()
+        response = self.post([second.uuid, missing, first.uuid, second.uuid])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(
+            [row["uuid"] for row in results],
+            [str(second.uuid), str(missing), str(first.uuid), str(second.uuid)],
+        )
+        self.assertEqual(results[1], {"uuid": str(missing), "detail": "Товар не найден."})
+        self.assertEqual(results[0], self.client.get(f"/api/v1/products/products/{second.uuid}/").json())
+
+    def test_constant_query_count(self):
+        for products in (self.products[:2], self.products):
+            cache.clear()
+            uuids = [product.uuid for product in products]
+            # Строки с updated_at, недостающие товары и их фото.
+            with self.assertNumQueries(3):
+                self.assertEqual(self.post(uuids).status_code, 200)
+            # Все фрагменты в кеше.
+            with self.assertNumQueries(1):
+                self.assertEqual(self.post(uuids).status_code, 200)
+
+    def test_limits(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post(["не uuid"]).status_code, 400)
+        too_many = [uuid.uuid4() for _ in range(settings.PRODUCT_BATCH_MAX_SIZE + 1)]
+        response = self.post(too_many)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("uuids", response.json())
+        self.assertEqual(self.post(too_many[:-1]).status_code, 200)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException("Сервер недоступен")
+
+
+class EmailOutboxTests(CachedTestCase):
+    def test_forgot_password_only_enqueues(self):
+        get_user_model().objects.create_user("user", email="user@example.com", password="x")
+        response = self.client.post("/api/v1/products/forgot-password/", {"email": "user@example.com"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.PENDING).count(), 1)
+
+        self.assertEqual(deliver_outbox(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["user@example.com"])
+        self.assertEqual(EmailOutbox.objects.get().status, EmailOutbox.SENT)
+
+    def test_drains_in_batches(self):
+        for i in range(5):
+            enqueue_mail("Тема", "Текст", [f"user{i}@example.com"])
+        self.assertEqual(deliver_outbox(batch_size=2), (5, 0))
+        self.assertEqual(len(mail.outbox), 5)
+
+    @override_settings(
+        EMAIL_BACKEND="apps.product.tests.FailingEmailBackend",
+        EMAIL_OUTBOX_RETRY_DELAY=0, EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    )
+    def test_retries_then_dead_letters(self):
+        message = enqueue_mail("Тема", "Текст", ["user@example.com"])
+        self.assertEqual(deliver_outbox(), (0, 3))
+        message.refresh_from_db()
+        self.assertEqual(message.status, EmailOutbox.DEAD)
+        self.assertEqual(message.attempts, 3)
+        self.assertIn("Сервер недоступен", message.last_error)
+
+
+@override_settings(PASSWORD_RESET_EMAIL_LIMIT=2)
+class PasswordResetCodeTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        get_user_model().objects.create_user("user", email="user@example.com", password="x")
+
+    def reset(self, code):
+        return self.client.post("/api/v1/products/reset-password/", {
+            "email": "user@example.com", "code": code, "new_password": "new-password",
+        })
+
+    def test_expired_code_is_rejected_and_purged(self):
+        code = PasswordResetCode.objects.create(email="user@example.com")
+        PasswordResetCode.objects.filter(pk=code.pk).update(
+            created_at=timezone.now() - timedelta(days=1)
+        )
+        self.assertEqual(self.reset(code.code).status_code, 400)
+
+        call_command("purge_reset_codes", batch_size=1, stdout=StringIO())
+        self.assertFalse(PasswordResetCode.objects.exists())
+
+    def test_attempts_are_throttled_per_email(self):
+        self.assertEqual(self.reset("000000").status_code, 400)
+        self.assertEqual(self.reset("000000").status_code, 400)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.reset("000000").status_code, 429)
+
+
+class EndpointBudgetTests(CachedTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        CatalogSeeder(200, seed=1, images_per_product=2).run()
+
+    def test_seed_is_deterministic(self):
+        rows = list(Product.objects.order_by("pk").values_list("uuid", "title", "price")[:20])
+        seeder = CatalogSeeder(200, seed=1, images_per_product=2)
+        # Первые 5 категорий по 5 моделей: генератор товаров зависит только от seed.
+        expected = [
+            (product.uuid, product.title, product.price)
+            for product in islice(seeder.product_rows(list(Models.objects.order_by("pk"))), 20)
+        ]
+        self.assertEqual(rows, expected)
+        self.assertEqual(ProductImage.objects.count(), 400)
+
+    def test_endpoints_within_budgets(self):
+        from core.wsgi import application
+
+        report = run_suite(application, requests=5)
+        self.assertEqual(check_budgets(report), [])
+        self.assertEqual(compare(report, report), [])
+
+
+class PopularityTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = create_catalog(6)
+
+    def view(self, product, times=1):
+        for _ in range(times):
+            self.assertEqual(self.client.get(f"/api/v1/products/products/{product.uuid}/").status_code, 200)
+
+    def test_views_are_buffered_and_upserted(self):
+        self.view(self.products[0], 3)
+        self.view(self.products[1])
+        self.assertFalse(ProductStats.objects.exists())
+
+        self.assertEqual(flush_views(), 2)
+        self.view(self.products[0], 2)
+        flush_views()
+        views = dict(ProductStats.objects.values_list("product_id", "views"))
+        self.assertEqual(views, {self.products[0].pk: 5, self.products[1].pk: 1})
+
+    def test_popular_ordering(self):
+        for times, product in enumerate(self.products[:4], start=1):
+            self.view(product, times)
+        flush_views()
+
+        url = "/api/v1/products/products/"
+        response = self.client.get(url, {"ordering": "popular", "page_size": 3})
+        body = response.json()
+        expected = [str(product.uuid) for product in reversed(self.products[:4])]
+        self.assertEqual([row["uuid"] for row in body["results"]], expected[:3])
+
+        response = self.client.get(body["next"])
+        self.assertEqual([row["uuid"] for row in response.json()["results"]], expected[3:])
+        self.assertIsNone(response.json()["next"])
+
+        # Рейтинг пересчитывается при записи просмотров.
+        self.view(self.products[0], 10)
+        flush_views()
+        response = self.client.get(url, {"ordering": "popular", "page_size": 1})
+        self.assertEqual(response.json()["results"][0]["uuid"], str(self.products[0].uuid))
+
+    def test_flush_and_ranking_read_primary(self):
+        self.view(self.products[2], 2)
+        # В тестах реплика - зеркало default, поэтому проверяем, что роутер
+        # вообще не выбирает базу для чтения.
+        with mock.patch(
+            "core.db_router.PrimaryReplicaRouter.db_for_read", side_effect=AssertionError,
+        ), use_replica():
+            flush_views()
+            self.assertEqual(refresh_ranking(), [self.products[2].pk])
+
+
+class ProductArchiveTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = create_catalog(10)
+        self.stale = self.products[:4]
+        Product.objects.filter(pk__in=[p.pk for p in self.stale]).update(is_active=False)
+        Product.objects.filter(pk__in=[p.pk for p in self.stale[:3]]).update(
+            updated_at=timezone.now() - timedelta(days=365)
+        )
+
+    def list_uuids(self, **params):
+        response = self.client.get("/api/v1/products/products/", {"page_size": 100, **params})
+        return {row["uuid"] for row in response.json()["results"]}
+
+    def test_list_is_active_only_by_default(self):
+        inactive = {str(p.uuid) for p in self.stale}
+        self.assertFalse(self.list_uuids() & inactive)
+        self.assertEqual(self.list_uuids(is_active="false"), inactive)
+        self.assertEqual(len(self.list_uuids(is_active="null")), 10)
+
+    def test_archive_and_restore(self):
+        stale = self.stale[0]
+        images = sorted(stale.images.values_list("image", flat=True))
+        with mock.patch.object(ProductImage.image.field.storage, "delete") as delete:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(archive_products(batch_size=2), 3)
+        delete.assert_not_called()
+
+        self.assertFalse(Product.objects.filter(pk__in=[p.pk for p in self.stale[:3]]).exists())
+        self.assertTrue(Product.objects.filter(pk=self.stale[3].pk).exists())
+        self.assertEqual(ArchivedProduct.objects.count(), 3)
+        self.assertEqual(
+            sorted(ArchivedProductImage.objects.filter(product_id=stale.pk).values_list("image", flat=True)),
+            images,
+        )
+        self.assertNotIn(stale.pk, product_index.search("Товар", limit=100))
+
+        self.assertEqual(restore_products([stale.uuid]), 1)
+        restored = Product.objects.get(uuid=stale.uuid)
+        self.assertEqual((restored.pk, restored.created_at), (stale.pk, stale.created_at))
+        self.assertEqual(sorted(restored.images.values_list("image", flat=True)), images)
+        self.assertIn(stale.pk, product_index.search("Товар", limit=100))
+        self.assertFalse(ArchivedProduct.objects.filter(uuid=stale.uuid).exists())
+
+
+class DummyReadView(ReplicaReadMixin, View):
+    def get(self, request):
+        return HttpResponse(router.db_for_read(Product))
+
+    def post(self, request):
+        return HttpResponse(router.db_for_read(Product))
+
+
+@mock.patch("core.db_router.has_replica", return_value=True)
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def test_reads_go_to_primary_unless_view_opts_in(self, has_replica):
+        self.assertEqual(router.db_for_read(Product), PRIMARY)
+        with use_replica():
+            self.assertEqual(router.db_for_read(Product), REPLICA)
+            with use_primary():
+                self.assertEqual(router.db_for_read(Product), PRIMARY)
+        self.assertEqual(router.db_for_read(Product), PRIMARY)
+
+    def test_view_mixin_respects_method_and_pin_cookie(self, has_replica):
+        factory = RequestFactory()
+        view = DummyReadView.as_view()
+        self.assertEqual(view(factory.get("/")).content.decode(), REPLICA)
+        self.assertEqual(view(factory.post("/")).content.decode(), PRIMARY)
+        pinned = factory.get("/")
+        pinned.COOKIES[PIN_COOKIE] = "1"
+        self.assertEqual(view(pinned).content.decode(), PRIMARY)
+
+    def test_export_stream_reads_replica(self, has_replica):
+        def records(cursor):
+            for _ in range(2):
+                yield {"db": router.db_for_read(Product)}
+
+        view = ExportAPIView.as_view(export_name="test", export_records=records)
+        response = view(RequestFactory().get("/"))
+        # Тело читается уже после выхода из dispatch.
+        lines = [json.loads(line) for line in response.streaming_content]
+        self.assertEqual(lines, [{"db": REPLICA}, {"db": REPLICA}])
+        self.assertEqual(router.db_for_read(Product), PRIMARY)
+
+
+class PrimaryReplicaRouterAtomicTests(TestCase):
+    @mock.patch("core.db_router.has_replica", return_value=True)
+    def test_reads_inside_atomic_go_to_primary(self, has_replica):
+        # TestCase и так держит транзакцию открытой.
+        with use_replica(), transaction.atomic():
+            self.assertEqual(router.db_for_read(Product), PRIMARY)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LaggingReplicaTests(TransactionTestCase):
+    """Реплика - отдельная база: снимок основной, сделанный до записи."""
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.addCleanup(take_buffer)
+        self.product = create_catalog(1)[0]
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "replica.sqlite3")
+
+        primary = connections[PRIMARY]
+        primary.ensure_connection()
+        with sqlite3.connect(path) as target:
+            primary.connection.backup(target)
+        self.enterContext(mock.patch.dict(
+            connections.settings, {REPLICA: {**primary.settings_dict, "NAME": path}},
+        ))
+        self.addCleanup(self.close_replica)
+        # Реплика появляется уже после проверки databases при настройке класса.
+        self.enterContext(mock.patch.object(type(self), "databases", {PRIMARY, REPLICA}))
+        self.enterContext(mock.patch("core.db_router.has_replica", return_value=True))
+
+    def close_replica(self):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+
+    def test_cache_is_not_rebuilt_from_lagging_replica(self):
+        self.product.title = "Новое название"
+        self.product.save()
+        self.assertEqual(Product.objects.using(REPLICA).get().title, "Товар 0")
+
+        responses = [
+            self.client.get("/api/v1/products/products/"),
+            async_to_sync(self.async_client.get)("/api/v1/products/async/products/"),
+            # Уже из кеша.
+            self.client.get("/api/v1/products/products/"),
+        ]
+        for response in responses:
+            self.assertEqual(response.json()["results"][0]["title"], "Новое название")
+
+
+class ProductImportTests(CachedTestCase):
+    def post(self, content, name="products.jsonl"):
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post("/api/v1/products/products/import/", {"file": upload})
+
+    def test_invalid_rows_are_reported_per_row(self):
+        valid = json.dumps({"title": "Кеды", "description": "Описание", "price": 100, "size": "42"})
+        lines = [
+            valid,
+            "5",
+            "{не json",
+            json.dumps({"title": "Кеды", "description": "Описание", "price": 100, "size": "42", "images": 5}),
+            json.dumps({"title": "Кеды", "description": "Описание", "price": 100, "size": "42", "category": [1]}),
+            valid,
+        ]
+        response = self.post("\n".join(lines))
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report["processed"], report["created"], report["failed"]), (6, 2, 4))
+        self.assertEqual([error["row"] for error in report["errors"]], [2, 3, 4, 5])
+        self.assertIn("images", report["errors"][2]["errors"])
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_bad_rows_across_batches(self):
+        valid = json.dumps({"title": "Кеды", "description": "Описание", "price": 100, "size": "42"})
+        with override_settings(PRODUCT_IMPORT_BATCH_SIZE=2):
+            response = self.post("\n".join([valid, valid, "[1, 2]", valid]))
+        report = response.json()
+        self.assertEqual((report["processed"], report["created"], report["failed"]), (4, 3, 1))
+
+    def test_csv_validation_errors(self):
+        content = "title,description,price,size\nКеды,Описание,100,42\nК,Описание,-1,42\n"
+        report = self.post(content, name="products.csv").json()
+        self.assertEqual((report["created"], report["failed"]), (1, 1))
+        self.assertEqual(set(report["errors"][0]["errors"]), {"title", "price"})
+
+
+class AsyncProductListTests(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = create_catalog(6)
+
+    def both(self, params):
+        sync = self.client.get("/api/v1/products/products/", params)
+        asynchronous = async_to_sync(self.async_client.get)("/api/v1/products/async/products/", params)
+        self.assertEqual(asynchronous.status_code, 200)
+        return sync.json(), asynchronous.json()
+
+    def test_facets_match_sync(self):
+        sync, asynchronous = self.both({"facets": "true", "page_size": 2})
+        self.assertIn("facets", asynchronous)
+        self.assertEqual(asynchronous["facets"], sync["facets"])
+        self.assertEqual(asynchronous["results"], sync["results"])
+
+    def test_popular_ordering_matches_sync(self):
+        for times, product in enumerate(self.products[:3], start=1):
+            for _ in range(times):
+                self.client.get(f"/api/v1/products/products/{product.uuid}/")
+        flush_views()
+        sync, asynchronous = self.both({"ordering": "popular", "page_size": 2})
+        self.assertEqual(
+            [row["uuid"] for row in asynchronous["results"]],
+            [str(self.products[2].uuid), str(self.products[1].uuid)],
+        )
+        self.assertEqual(asynchronous["results"], sync["results"])
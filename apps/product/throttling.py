@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+class AttemptThrottle(BaseThrottle):
+    """
+    Счётчики попыток в кеше с фиксированным окном: по email из тела
+    запроса и по IP. Лишние попытки отклоняются с 429 ещё до обращения
+    к базе и почте.
+    """
+    scope = None
+
+    def get_limits(self, request):
+        """Пары (идентификатор, лимит)."""
+        limits = [(f"ip:{self.get_ident(request)}", settings.PASSWORD_RESET_IP_LIMIT)]
+        email = request.data.get("email") if hasattr(request.data, "get") else None
+        if email:
+            limits.append((f"email:{str(email).strip().lower()}", settings.PASSWORD_RESET_EMAIL_LIMIT))
+        return limits
+
+    def hit(self, ident, window):
+        key = f"throttle:{self.scope}:{ident}:{int(time.time() // window)}"
+        cache.add(key, 0, timeout=window)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Ключ успел истечь между add и incr.
+            cache.set(key, 1, timeout=window)
+            return 1
+
+    def allow_request(self, request, view):
+        window = settings.PASSWORD_RESET_THROTTLE_WINDOW
+        for ident, limit in self.get_limits(request):
+            if self.hit(ident, window) > limit:
+                return False
+        return True
+
+    def wait(self):
+        window = settings.PASSWORD_RESET_THROTTLE_WINDOW
+        return window - time.time() % window
+
+
+class ForgotPasswordThrottle(AttemptThrottle):
+    scope = "forgot_password"
+
+
+class ResetPasswordThrottle(AttemptThrottle):
+    scope = "reset_password"
@@ -1,7 +1,9 @@
 from django.urls import path, include
-from apps.product.views import ProductListAPIView, ProductDetailAPIView, ProductCreateAPIView
+from apps.product.views import ProductListAPIView, ProductDetailAPIView, ProductBatchAPIView, ProductBulkUpdateAPIView, ProductCreateAPIView, ProductImportAPIView, ProductExportAPIView, ProductSearchAPIView
 from rest_framework.routers import DefaultRouter
-from .views import BookViewSet, CategoryListCreateAPIView, CategoryDetailAPIView, ModelsListCreateAPIView, ModelsDetailAPIView
+from apps.product import async_views
+from .views import BookViewSet, BookExportAPIView, BookSearchAPIView, CategoryListCreateAPIView, CategoryDetailAPIView, ModelsListCreateAPIView, ModelsDetailAPIView
+from .views import ForgotPasswordView, ResetPasswordView
 
 router = DefaultRouter()
 router.register(r'books', BookViewSet, basename='book')
@@ -9,10 +11,26 @@ router.register(r'books', BookViewSet, basename='book')
 urlpatterns = [
     path("products/", ProductListAPIView.as_view(), name='product-list'),
     path("products/<uuid:uuid>/", ProductDetailAPIView.as_view(), name='product-detail'),
+    path("products/batch/", ProductBatchAPIView.as_view(), name='product-batch'),
+    path("products/bulk-update/", ProductBulkUpdateAPIView.as_view(), name='product-bulk-update'),
     path("products/create/", ProductCreateAPIView.as_view(), name='create'),
+    path("products/import/", ProductImportAPIView.as_view(), name='product-import'),
+    path("products/export/", ProductExportAPIView.as_view(), name='product-export'),
+    path("products/search/", ProductSearchAPIView.as_view(), name='product-search'),
+    path("books/export/", BookExportAPIView.as_view(), name='book-export'),
+    path("books/search/", BookSearchAPIView.as_view(), name='book-search'),
     path('', include(router.urls)),
     path('categories/', CategoryListCreateAPIView.as_view(), name='category-list'),
     path('categories/<int:pk>/', CategoryDetailAPIView.as_view(), name='category-detail'),
     path('models/', ModelsListCreateAPIView.as_view(), name='models-list'),
     path('models/<int:pk>/', ModelsDetailAPIView.as_view(), name='models-detail'),
+    # Асинхронные варианты для чтения (ASGI)
+    path("async/products/", async_views.AsyncProductListView.as_view(), name='async-product-list'),
+    path("async/products/<uuid:uuid>/", async_views.AsyncProductDetailView.as_view(), name='async-product-detail'),
+    path("async/books/", async_views.AsyncBookListView.as_view(), name='async-book-list'),
+    path("async/books/<int:pk>/", async_views.AsyncBookDetailView.as_view(), name='async-book-detail'),
+    path("async/categories/", async_views.AsyncCategoryListView.as_view(), name='async-category-list'),
+    path("async/models/", async_views.AsyncModelsListView.as_view(), name='async-models-list'),
+    path('forgot-password/', ForgotPasswordView.as_view(), name='forgot-password'),
+    path('reset-password/', ResetPasswordView.as_view(), name='reset-password'),
 ]
\ No newline at end of file
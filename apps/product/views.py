@@ -1,53 +1,280 @@
+import csv
+
 from rest_framework.views import APIView
-from urllib3 import request
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.shortcuts import render, redirect
 from rest_framework.response import Response
 from rest_framework import status
-from django.core.cache import cache
 from django.shortcuts import get_object_or_404
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from rest_framework.generics import CreateAPIView
+from django.utils.decorators import method_decorator
+from django.views.static import serve
+
+from core.db_router import ReplicaReadMixin, iterate_on_replica, replica_allowed
+
+from apps.product.bulk import ProductBulkUpdater
+from apps.product.importers import IMPORT_FORMATS, ProductImporter, read_rows
+from apps.product.cache import CachedViewMixin, conditional_get, defer_invalidation, get_or_build
+from apps.product.models import Category, Models, Product, ProductImage
+from apps.product.pagination import KeysetPagination, decode_cursor
+from apps.product.popularity import POPULAR_DEPENDS_ON, build_popular_list, popular_list_key, record_view
+from apps.product.exporters import (
+    BOOK_EXPORT_FIELDS, PRODUCT_EXPORT_FIELDS, CSVRenderer, NDJSONRenderer,
+    export_books, export_products, stream_csv, stream_ndjson,
+)
+from apps.product.fragments import DETAIL_DEPENDS_ON, detail_fragments, join_fragments, list_fragments
+from apps.product.metrics import timed_serialization
+from apps.product.filters import active_filters, filter_products, filters_key, get_facets
+from apps.product.search import book_index, product_index
+from apps.product.sparse import sparse_key
+from apps.product.storage import BLOB_CACHE_CONTROL, ContentAddressedStorage
+from apps.product.serializers import (
+    ProductBatchSerializer, ProductBulkUpdateSerializer, ProductDetailSerializer, ProductCreateSerializer,
+    ProductFilterSerializer, ProductSerializer,
+    ProductSearchQuerySerializer, SearchQuerySerializer,
+)
 
-from apps.product.models import Product
-from apps.product.serializers import ProductSerializer, ProductDetailSerializer, ProductCreateSerializer
-
-serializer = ProductSerializer(data=request.data)
 
 class ProductCreateAPIView(CreateAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductCreateSerializer
 
-class ProductListAPIView(APIView):
+    def perform_create(self, serializer):
+        with defer_invalidation():
+            serializer.save()
+
+
+class ProductImportAPIView(APIView):
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"file": "Файл не передан."}, status=status.HTTP_400_BAD_REQUEST)
+
+        format = request.data.get("format") or upload.name.rsplit(".", 1)[-1].lower()
+        if format not in IMPORT_FORMATS:
+            return Response(
+                {"format": f"Поддерживаются форматы: {', '.join(IMPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        importer = ProductImporter(batch_size=settings.PRODUCT_IMPORT_BATCH_SIZE)
+        try:
+            report = importer.run(read_rows(upload.file, format))
+        except (ValueError, csv.Error) as exc:
+            report = importer.report()
+            report["detail"] = f"Не удалось прочитать файл: {exc}"
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class ExportAPIView(ReplicaReadMixin, APIView):
+    """
+    Потоковая выгрузка: ?format=ndjson (по умолчанию) или ?format=csv.
+    Каждая запись содержит cursor - с него можно продолжить оборванную
+    выгрузку через ?cursor=.
+    """
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    export_name = None
+    export_fields = ()
+    # Функция cursor -> итератор записей (см. apps.product.exporters).
+    export_records = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        if initkwargs.get("export_records", cls.export_records) is None:
+            raise ImproperlyConfigured(f"{cls.__name__} должен задать export_records.")
+        return super().as_view(**initkwargs)
+
+    def get(self, request):
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            decode_cursor(cursor)
+        records = self.export_records(cursor)
+
+        renderer = request.accepted_renderer
+        if renderer.format == "csv":
+            content = stream_csv(records, self.export_fields)
+        else:
+            content = stream_ndjson(records)
+        if replica_allowed(request):
+            content = iterate_on_replica(content)
+        response = StreamingHttpResponse(content, content_type=f"{renderer.media_type}; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{self.export_name}.{renderer.format}"'
+        return response
+
+
+class ProductExportAPIView(ExportAPIView):
+    export_name = "products"
+    export_fields = (*PRODUCT_EXPORT_FIELDS, "images")
+    export_records = staticmethod(export_products)
+
+
+class ProductSearchAPIView(ReplicaReadMixin, APIView):
+    def get(self, request):
+        params = ProductSearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        ids = product_index.search(
+            query["q"], limit=query["limit"], offset=query["offset"],
+            category_id=query.get("category"), is_active=query["is_active"],
+        )
+        rows = {row["id"]: row for row in Product.objects.filter(pk__in=ids).values("id", "updated_at")}
+        fragments = list_fragments([rows[pk] for pk in ids if pk in rows])
+        content = b'{"results":' + join_fragments(fragments) + b'}'
+        return HttpResponse(content, content_type="application/json")
+
+
+class ProductListAPIView(ReplicaReadMixin, APIView):
+    """
+    Лента товаров от новых к старым; ?ordering=popular - по готовому
+    рейтингу просмотров (apps.product.popularity), который пересчитывается
+    при записи накопленных просмотров, а не сортируется на каждый запрос.
+    """
+    pagination_class = KeysetPagination
+    cache_depends_on = (Product, ProductImage)
+
     def get(self, request):
-        cache_key = "product_list"
-        cached_data = cache.get(cache_key)
+        params = ProductFilterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        if params.validated_data["ordering"] == "popular":
+            return self.list_popular(request, params.validated_data)
+        return self.list_newest(request, params.validated_data)
+
+    @method_decorator(conditional_get(*cache_depends_on))
+    def list_newest(self, request, params):
+        filters = active_filters(params)
+
+        paginator = self.pagination_class()
+        page_size = paginator.get_page_size(request)
+        cursor = request.query_params.get(paginator.cursor_query_param, "")
+
+        def build():
+            rows = filter_products(Product.objects.all(), filters)
+            rows = rows.values("id", "created_at", "updated_at")
+            page = paginator.paginate_queryset(rows, request, view=self)
+            results = join_fragments(list_fragments(page))
+            return {"results": results, "next_cursor": paginator.next_cursor}
+
+        def build_sparse():
+            # Частичное представление собирается мимо фрагментов.
+            products = ProductSerializer.optimize_queryset(
+                filter_products(Product.objects.prefetch_related("images"), filters),
+                request, required=("created_at",),
+            )
+            page = paginator.paginate_queryset(products, request, view=self)
+            serializer = ProductSerializer(page, many=True, context={"sparse_request": request})
+            with timed_serialization():
+                results = JSONRenderer().render(serializer.data)
+            return {"results": results, "next_cursor": paginator.next_cursor}
+
+        fields = sparse_key(request)
+        data = get_or_build(
+            f"product_list:{page_size}:{cursor}:{filters_key(filters)}:{fields}",
+            build_sparse if fields else build,
+            depends_on=self.cache_depends_on,
+        )
+        extra = {"facets": get_facets(filters)} if params["facets"] else None
+        return paginator.build_raw_response(
+            request, data["results"], data["next_cursor"], extra=extra
+        )
 
-        if cached_data:
-            # print("\n\n\n\nCache\n\n\n\n")
-            return Response(cached_data, status=status.HTTP_200_OK)
+    @method_decorator(conditional_get(*POPULAR_DEPENDS_ON))
+    def list_popular(self, request, params):
+        filters = active_filters(params)
 
-        # print("\n\n\n\nDB\n\n\n\n")
+        paginator = self.pagination_class()
+        page_size = paginator.get_page_size(request)
+        cursor = request.query_params.get(paginator.cursor_query_param, "")
 
-        products = (
-            Product.objects
-            .select_related("category", "model")
-            .prefetch_related("images")
-            .order_by("-created_at")
+        data = get_or_build(
+            popular_list_key(page_size, cursor, filters, sparse_key(request)),
+            lambda: build_popular_list(request, filters, cursor, page_size),
+            depends_on=POPULAR_DEPENDS_ON,
+        )
+        extra = {"facets": get_facets(filters)} if params["facets"] else None
+        return paginator.build_raw_response(
+            request, data["results"], data["next_cursor"], extra=extra
         )
-        serializer = ProductSerializer(products, many=True)
-        cache.set(cache_key, serializer.data, timeout=60 * 2)
-        return Response(serializer.data, status=status.HTTP_200_OK)
 
-class ProductDetailAPIView(APIView):
-    
+
+class ProductBatchAPIView(APIView):
+    """
+    Детальные представления нескольких товаров за один запрос, в порядке
+    uuids. Готовые фрагменты берутся из кеша, недостающие строятся одним
+    запросом с select_related и одним prefetch фото.
+    """
+
+    def post(self, request):
+        params = ProductBatchSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        uuids = [str(uuid) for uuid in params.validated_data["uuids"]]
+
+        fragments = detail_fragments(set(uuids))
+        results = [
+            fragments.get(uuid) or JSONRenderer().render(
+                {"uuid": uuid, "detail": "Товар не найден."}
+            )
+            for uuid in uuids
+        ]
+        return HttpResponse(b'{"results":' + join_fragments(results) + b'}', content_type="application/json")
+
+
+class ProductBulkUpdateAPIView(APIView):
+    """
+    {"items": [{"uuid": ..., "price": ...}, ...], "dry_run": false}
+
+    Статус строки в отчёте - updated, unchanged или error. Если есть хотя бы
+    одна ошибка или dry_run, изменения не применяются (applied: false).
+    """
+
+    def post(self, request):
+        params = ProductBulkUpdateSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        report = ProductBulkUpdater(
+            params.validated_data["items"], dry_run=params.validated_data["dry_run"]
+        ).run()
+        code = status.HTTP_400_BAD_REQUEST if report["failed"] else status.HTTP_200_OK
+        return Response(report, status=code)
+
+
+class ProductDetailAPIView(ReplicaReadMixin, APIView):
+
     def get_object(self, uuid):
         return get_object_or_404(
             Product.objects.select_related("category", "model")
             .prefetch_related("images"), uuid=uuid
         )
 
+    @method_decorator(conditional_get(
+        *DETAIL_DEPENDS_ON,
+        row_modified=lambda uuid: (
+            Product.objects.filter(uuid=uuid)
+            .values_list("updated_at", flat=True).first()
+        ),
+    ))
     def get(self, request, uuid):
-        serializer = ProductDetailSerializer(self.get_object(uuid))
-        return Response(serializer.data)
+        if sparse_key(request):
+            product = get_object_or_404(
+                ProductDetailSerializer.optimize_queryset(
+                    Product.objects.select_related("category", "model")
+                    .prefetch_related("images"), request,
+                ),
+                uuid=uuid,
+            )
+            record_view(uuid)
+            return Response(ProductDetailSerializer(product, context={"sparse_request": request}).data)
+
+        fragment = detail_fragments([uuid]).get(str(uuid))
+        if fragment is None:
+            raise Http404("No Product matches the given query.")
+        record_view(uuid)
+        return HttpResponse(fragment, content_type="application/json")
     
     def put(self, request, uuid):
         product = self.get_object(uuid)
@@ -55,7 +282,6 @@ class ProductDetailAPIView(APIView):
 
         if serializer.is_valid():
             serializer.save()
-            cache.delete("product_list")
             return Response(serializer.data)
 
         return Response(serializer.errors, status=400)
@@ -66,44 +292,79 @@ class ProductDetailAPIView(APIView):
 
         if serializer.is_valid():
             serializer.save()
-            cache.delete("product_list")
             return Response(serializer.data)
 
         return Response(serializer.errors, status=400)
 
     def delete(self, request, uuid):
         self.get_object(uuid).delete()
-        cache.delete("product_list")
         return Response(status=204)
 
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from rest_framework import viewsets
 from .models import Book
 from .serializers import BookSerializer
 
-class BookViewSet(viewsets.ModelViewSet):
+
+class BookViewSet(ReplicaReadMixin, CachedViewMixin, viewsets.ModelViewSet):
     serializer_class = BookSerializer
+    cache_namespace = "book"
+    cache_depends_on = (Book, Category)
 
     def get_queryset(self):
-        return Book.objects.select_related('category').all()
+        queryset = Book.objects.select_related('category').all()
+        if self.request.method == "GET":
+            queryset = BookSerializer.optimize_queryset(queryset, self.request)
+        return queryset
 
-    @method_decorator(cache_page(60))
+    @method_decorator(conditional_get(*cache_depends_on))
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @method_decorator(conditional_get(*cache_depends_on))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class BookSearchAPIView(ReplicaReadMixin, APIView):
+    def get(self, request):
+        params = SearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        ids = book_index.search(
+            query["q"], limit=query["limit"], offset=query["offset"],
+            category_id=query.get("category"),
+        )
+        books = Book.objects.in_bulk(ids)
+        serializer = BookSerializer([books[pk] for pk in ids if pk in books], many=True)
+        return Response({"results": serializer.data})
+
+
+class BookExportAPIView(ExportAPIView):
+    export_name = "books"
+    export_fields = BOOK_EXPORT_FIELDS
+    export_records = staticmethod(export_books)
+
 from rest_framework import mixins, generics
-from .models import Category, Models
 from .serializers import CategorySerializer, ModelsSerializer
 
 # --- CRUD для Категорий ---
 
-class CategoryListCreateAPIView(mixins.ListModelMixin, 
+class CategoryListCreateAPIView(ReplicaReadMixin, CachedViewMixin,
+        mixins.ListModelMixin, 
         mixins.CreateModelMixin, 
         generics.GenericAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_namespace = "category"
+    cache_depends_on = (Category,)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == "GET":
+            queryset = self.serializer_class.optimize_queryset(queryset, self.request)
+        return queryset
 
+    @method_decorator(conditional_get(*cache_depends_on))
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
@@ -111,7 +372,7 @@ class CategoryListCreateAPIView(mixins.ListModelMixin,
         return self.create(request, *args, **kwargs)
 
 
-class CategoryDetailAPIView(mixins.RetrieveModelMixin, 
+class CategoryDetailAPIView(ReplicaReadMixin, mixins.RetrieveModelMixin, 
         mixins.UpdateModelMixin, 
         mixins.DestroyModelMixin, 
         generics.GenericAPIView):
@@ -127,12 +388,23 @@ class CategoryDetailAPIView(mixins.RetrieveModelMixin,
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
-class ModelsListCreateAPIView(mixins.ListModelMixin, 
+
+class ModelsListCreateAPIView(ReplicaReadMixin, CachedViewMixin,
+        mixins.ListModelMixin, 
         mixins.CreateModelMixin, 
         generics.GenericAPIView):
-    queryset = Models.objects.all()
+    queryset = Models.objects.select_related('category')
     serializer_class = ModelsSerializer
+    cache_namespace = "models"
+    cache_depends_on = (Models, Category)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == "GET":
+            queryset = self.serializer_class.optimize_queryset(queryset, self.request)
+        return queryset
+
+    @method_decorator(conditional_get(*cache_depends_on))
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
@@ -140,11 +412,11 @@ class ModelsListCreateAPIView(mixins.ListModelMixin,
         return self.create(request, *args, **kwargs)
 
 
-class ModelsDetailAPIView(mixins.RetrieveModelMixin, 
+class ModelsDetailAPIView(ReplicaReadMixin, mixins.RetrieveModelMixin, 
         mixins.UpdateModelMixin, 
         mixins.DestroyModelMixin, 
         generics.GenericAPIView):
-    queryset = Models.objects.all()
+    queryset = Models.objects.select_related('category')
     serializer_class = ModelsSerializer
 
     def get(self, request, *args, **kwargs):
@@ -156,33 +428,41 @@ class ModelsDetailAPIView(mixins.RetrieveModelMixin,
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
-from django.core.mail import send_mail
+from django.db import transaction
+from apps.product.mail import enqueue_mail
+from apps.product.throttling import ForgotPasswordThrottle, ResetPasswordThrottle
 from .models import PasswordResetCode
 from .serializers import ForgotPasswordSerializer, ResetPasswordSerializer
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+
 class ForgotPasswordView(APIView):
+    throttle_classes = [ForgotPasswordThrottle]
+
     def post(self, request):
         serializer = ForgotPasswordSerializer(data=request.data)
         if serializer.is_valid():
             email = serializer.validated_data['email']
             if User.objects.filter(email=email).exists():
-                PasswordResetCode.objects.filter(email=email).delete()
-                reset_obj = PasswordResetCode.objects.create(email=email)
-                send_mail(
-                    'Код для сброса пароля',
-                    f'Ваш код подтверждения: {reset_obj.code}',
-                    'noreply@myapp.com',
-                    [email],
-                    fail_silently=False,
-                )
+                with transaction.atomic():
+                    PasswordResetCode.objects.filter(email=email).delete()
+                    reset_obj = PasswordResetCode.objects.create(email=email)
+                    # Письмо отправит команда send_outbox.
+                    enqueue_mail(
+                        'Код для сброса пароля',
+                        f'Ваш код подтверждения: {reset_obj.code}',
+                        [email],
+                    )
                 return Response({"message": "Код отправлен на почту."}, status=status.HTTP_200_OK)
             return Response({"error": "Пользователь с такой почтой не найден."}, status=status.HTTP_404_NOT_FOUND)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
 class ResetPasswordView(APIView):
+    throttle_classes = [ResetPasswordThrottle]
+
     def post(self, request):
         serializer = ResetPasswordSerializer(data=request.data)
         if serializer.is_valid():
@@ -195,4 +475,13 @@ class ResetPasswordView(APIView):
             PasswordResetCode.objects.filter(email=email).delete()
             
             return Response({"message": "Пароль успешно изменен."}, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+def serve_blob(request, path):
+    # Только для разработки (DEBUG), см. core/urls.py. Имя файла - хеш
+    # содержимого, поэтому ответ можно кешировать навсегда.
+    storage = ContentAddressedStorage()
+    response = serve(request, path, document_root=storage.path(storage.blob_dir))
+    response["Cache-Control"] = BLOB_CACHE_CONTROL
+    return response
@@ -0,0 +1,234 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    count INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats SET count = count + 1, size = size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats SET count = count - 1, size = size - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache BEGIN
+    UPDATE cache_stats SET size = size + NEW.size - OLD.size;
+END;
+"""
+
+UPSERT = """
+INSERT INTO cache (key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value, expires = excluded.expires,
+    accessed = excluded.accessed, size = excluded.size
+"""
+
+
+class SQLiteCache(BaseCache):
+    """
+    Кеш, общий для всех процессов на хосте, поверх файла SQLite в режиме WAL.
+
+    Читатели не блокируют друг друга и писателя, запись сериализуется
+    блокировкой SQLite, поэтому add() и incr() атомарны между воркерами.
+    Вытеснение - LRU по времени последнего чтения, при превышении
+    MAX_ENTRIES или MAX_SIZE (в байтах).
+
+    OPTIONS:
+        MAX_ENTRIES, CULL_FREQUENCY - как у встроенных бэкендов;
+        MAX_SIZE - предел суммарного размера значений;
+        MMAP_SIZE - размер отображаемой в память части файла.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+    # Время последнего чтения обновляется не чаще раза в секунду,
+    # чтобы чтения не превращались в запись.
+    access_resolution = 1.0
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._path = str(location)
+        self._max_size = int(options.get("MAX_SIZE", 256 * 1024 * 1024))
+        self._mmap_size = int(options.get("MMAP_SIZE", 64 * 1024 * 1024))
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={self._mmap_size}")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _expired(self, expires, now):
+        return expires is not None and expires <= now
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._get_many([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys_map = {self.make_and_validate_key(k, version=version): k for k in keys}
+        found = self._get_many(list(keys_map))
+        return {keys_map[k]: value for k, value in found.items()}
+
+    def _get_many(self, keys):
+        if not keys:
+            return {}
+        conn = self._connection()
+        now = time.time()
+        placeholders = ",".join("?" * len(keys))
+        rows = conn.execute(
+            f"SELECT key, value, expires, accessed FROM cache WHERE key IN ({placeholders})",
+            keys,
+        ).fetchall()
+
+        found, expired, touched = {}, [], []
+        for key, value, expires, accessed in rows:
+            if self._expired(expires, now):
+                expired.append(key)
+                continue
+            found[key] = pickle.loads(value)
+            if now - accessed > self.access_resolution:
+                touched.append((now, key))
+
+        if expired or touched:
+            with self._write() as conn:
+                conn.executemany(
+                    "DELETE FROM cache WHERE key = ? AND expires <= ?",
+                    [(key, now) for key in expired],
+                )
+                conn.executemany("UPDATE cache SET accessed = ? WHERE key = ?", touched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._set_many({key: value}, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._set_many(
+            {self.make_and_validate_key(k, version=version): v for k, v in data.items()},
+            timeout,
+        )
+        return []
+
+    def _set_many(self, data, timeout):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = []
+        for key, value in data.items():
+            blob = pickle.dumps(value, self.pickle_protocol)
+            rows.append((key, blob, expires, now, len(blob)))
+        with self._write() as conn:
+            conn.executemany(UPSERT, rows)
+            self._cull(conn, now)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        blob = pickle.dumps(value, self.pickle_protocol)
+        now = time.time()
+        with self._write() as conn:
+            row = conn.execute("SELECT expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and not self._expired(row[0], now):
+                return False
+            conn.execute(UPSERT, (key, blob, self.get_backend_timeout(timeout), now, len(blob)))
+            self._cull(conn, now)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self._write() as conn:
+            row = conn.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1], now):
+                raise ValueError("Key '%s' not found" % key)
+            new_value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(new_value, self.pickle_protocol)
+            conn.execute(
+                "UPDATE cache SET value = ?, size = ?, accessed = ? WHERE key = ?",
+                (blob, len(blob), now, key),
+            )
+        return new_value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self._write() as conn:
+            cursor = conn.execute(
+                "UPDATE cache SET expires = ?, accessed = ? "
+                "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (self.get_backend_timeout(timeout), now, key, now),
+            )
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            "SELECT expires FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        return row is not None and not self._expired(row[0], time.time())
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as conn:
+            cursor = conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        keys = [(self.make_and_validate_key(k, version=version),) for k in keys]
+        with self._write() as conn:
+            conn.executemany("DELETE FROM cache WHERE key = ?", keys)
+
+    def clear(self):
+        with self._write() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def _cull(self, conn, now):
+        count, size = conn.execute("SELECT count, size FROM cache_stats").fetchone()
+        if count <= self._max_entries and size <= self._max_size:
+            return
+        conn.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        if self._cull_frequency == 0:
+            conn.execute("DELETE FROM cache")
+            return
+        count, size = conn.execute("SELECT count, size FROM cache_stats").fetchone()
+        while count > self._max_entries or size > self._max_size:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (max(count // self._cull_frequency, 1),),
+            )
+            count, size = conn.execute("SELECT count, size FROM cache_stats").fetchone()
@@ -0,0 +1,130 @@
+"""
+Чтение с реплики, запись в основную базу.
+
+По умолчанию всё читает из основной базы: команды, фоновые потоки,
+обработчики сигналов и любые запросы внутри transaction.atomic. С реплики
+читают только представления, которые явно это разрешили
+(ReplicaReadMixin, use_replica), и только для GET/HEAD/OPTIONS.
+
+Пока реплика отстаёт, клиент, который только что что-то записал, мог бы
+не увидеть своих изменений. Поэтому после запроса с записью клиент ещё
+DATABASE_PRIMARY_PIN_SECONDS читает из основной базы (cookie).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = "default"
+REPLICA = "replica"
+PIN_COOKIE = "db_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_use_replica = ContextVar("use_replica", default=False)
+
+
+@contextmanager
+def use_replica():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def use_primary():
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def iterate_on_replica(iterable):
+    """
+    Отдаёт элементы iterable, вычисляя каждый внутри use_replica().
+
+    Тело StreamingHttpResponse читается уже после выхода из dispatch(), а
+    переменная контекста между элементами не держится: сервер может
+    вычислять их в разных контекстах.
+    """
+    iterator = iter(iterable)
+    while True:
+        with use_replica():
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def has_replica():
+    # В тестах реплика - зеркало default (TEST.MIRROR) и указывает на тот же
+    # файл; читать её отдельным соединением незачем.
+    if REPLICA not in settings.DATABASES:
+        return False
+    return connections[REPLICA].settings_dict["NAME"] != connections[PRIMARY].settings_dict["NAME"]
+
+
+def replica_allowed(request):
+    """Запрос только читает, и клиент ничего не записывал последние секунды."""
+    return request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Внутри транзакции читаем то, что сами же пишем.
+        if not _use_replica.get() or connections[PRIMARY].in_atomic_block or not has_replica():
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+class ReplicaReadMixin:
+    """Представление DRF/Django, чьи GET-запросы можно читать с реплики."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not replica_allowed(request):
+            return super().dispatch(request, *args, **kwargs)
+        with use_replica():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class PrimaryPinMiddleware:
+    # Поддерживает и ASGI без переключения в поток на каждый запрос.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, "1",
+                max_age=settings.DATABASE_PRIMARY_PIN_SECONDS,
+                httponly=True, samesite="Lax",
+            )
+        return response
@@ -33,6 +33,28 @@ EMAIL_PORT = os.getenv("EMAIL_PORT")
 EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS") == "True"
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
+DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "noreply@myapp.com")
+
+# Очередь писем (apps.product.mail, команда send_outbox)
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60  # секунд, удваивается с каждой попыткой
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 60 * 60
+EMAIL_OUTBOX_CLAIM_TTL = 5 * 60
+
+# Метрики запросов (apps.product.metrics): детектор медленных запросов и N+1
+PERF_DETECTOR = os.getenv("PERF_DETECTOR") == "True"
+PERF_SLOW_QUERY_MS = 100
+PERF_N_PLUS_ONE_THRESHOLD = 5
+# Кто может читать /metrics: адреса (REMOTE_ADDR) или Bearer-токен.
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",") if ip]
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Коды сброса пароля
+PASSWORD_RESET_CODE_TTL = 15 * 60
+PASSWORD_RESET_THROTTLE_WINDOW = 60 * 60
+PASSWORD_RESET_EMAIL_LIMIT = 5  # попыток на email за окно
+PASSWORD_RESET_IP_LIMIT = 20  # попыток с одного IP за окно
 
 # SECURITY WARNING: don't run with debug turned on in production!
 
@@ -55,7 +77,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.product.metrics.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.db_router.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -87,13 +111,43 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+SQLITE_OPTIONS = {
+    # Ждать освобождения блокировки вместо мгновенного "database is locked".
+    'timeout': 20,
+    # Транзакции сразу берут блокировку записи - без взаимных блокировок
+    # при повышении чтения до записи.
+    'transaction_mode': 'IMMEDIATE',
+    # WAL: читатели не ждут писателя.
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA cache_size=-65536;'
+    ),
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Реплика только для чтения - копия основной базы, которую поддерживает
+# внешняя репликация (например, litestream). В тестах - зеркало default.
+if os.getenv("DATABASE_REPLICA"):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv("DATABASE_REPLICA"),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+DATABASE_PRIMARY_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -135,11 +189,58 @@ STATIC_ROOT = BASE_DIR / '/static'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / '/media'
 
+# Миниатюры и WebP строятся в пуле процессов вне запроса.
+# 0 - строить синхронно после коммита (удобно для разработки и тестов).
+PRODUCT_IMAGE_WORKERS = int(os.getenv("PRODUCT_IMAGE_WORKERS", 2))
+PRODUCT_THUMBNAIL_SIZE = (320, 320)
+PRODUCT_WEBP_MAX_SIZE = (1280, 1280)
+PRODUCT_IMAGE_QUALITY = 80
+# Файл фото удаляется не раньше, чем через столько секунд после последней
+# загрузки с тем же содержимым (apps/product/storage.py).
+BLOB_RELEASE_GRACE_SECONDS = 60 * 60
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+PRODUCT_LIST_PAGE_SIZE = int(os.getenv("PRODUCT_LIST_PAGE_SIZE", 20))
+PRODUCT_LIST_MAX_PAGE_SIZE = 100
+PRODUCT_IMPORT_BATCH_SIZE = 1000
+PRODUCT_BATCH_MAX_SIZE = 300
+
+# Просмотры копятся в памяти воркера и пишутся в ProductStats не чаще раза
+# в POPULARITY_FLUSH_INTERVAL секунд; ?ordering=popular - первые POPULAR_TOP_N.
+POPULARITY_FLUSH_INTERVAL = 10
+POPULAR_TOP_N = 1000
+
+# Неактивные дольше стольких дней товары уходят в архив (команда archive_products).
+PRODUCT_ARCHIVE_AFTER_DAYS = 90
+PRODUCT_ARCHIVE_BATCH_SIZE = 500
+PRODUCT_BULK_UPDATE_MAX_SIZE = 5000
+
+# Свежая запись отдаётся до SOFT_TTL, устаревшая - до HARD_TTL, пока один
+# запрос перестраивает её под блокировкой. Актуальность обеспечивает
+# инвалидация по сигналам (apps/product/signals.py), поэтому TTL большие.
+CACHE_REBUILD_LOCK_TTL = 10
+CACHE_SOFT_TTL = 60 * 60
+CACHE_HARD_TTL = 60 * 60 * 6
+# Фрагменты товаров адресуются по updated_at и сами не устаревают.
+PRODUCT_FRAGMENT_TTL = 60 * 60 * 24
+
+# In-process L1 перед общим кешем. Версии моделей сверяются с общим кешем
+# не чаще раза в CACHE_VERSION_CHECK_INTERVAL секунд - это и есть предел
+# задержки, с которой запись видна остальным воркерам.
+CACHE_L1_MAX_ENTRIES = 1000
+CACHE_VERSION_CHECK_INTERVAL = 1
+
+# Один файл кеша на хост: все воркеры gunicorn видят одни и те же записи
+# и одну и ту же инвалидацию.
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "unique-snowflake",
+        "BACKEND": "core.cache_backends.SQLiteCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", BASE_DIR / "cache.sqlite3"),
+        "TIMEOUT": 300,
+        "OPTIONS": {
+            "MAX_ENTRIES": 100000,
+            "MAX_SIZE": 256 * 1024 * 1024,
+        },
     }
 }
@@ -1,17 +1,28 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from apps.product.metrics import metrics_view
+from apps.product.views import serve_blob
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("api/v1/settings/", include("apps.settings.urls")),
     path("api/v1/products/", include("apps.product.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
+if settings.DEBUG:
+    # В продакшене blobs/ отдаёт веб-сервер (deploy/nginx/media.conf).
+    # Маршрут стоит раньше общего static(): тот тоже совпал бы с blobs/.
+    urlpatterns += [
+        re_path(rf"^{settings.MEDIA_URL.lstrip('/')}blobs/(?P<path>.*)$", serve_blob),
+    ]
+
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)